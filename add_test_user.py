@@ -14,7 +14,7 @@ async def add_test_user():
     """Add the test user to Xray server."""
     print("Adding test user to Xray server...")
     
-    server_manager = ServerManager()
+    server_manager = ServerManager.get_instance()
     
     # User details from the VLESS URL
     test_email = "user_2@xray.com"
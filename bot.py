@@ -13,19 +13,16 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from sqlalchemy import select, update, delete, func
+from sqlalchemy import select, update, delete, func, and_
 from sqlalchemy.orm import selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import settings
-from db import db, User, UserKey, Subscription, get_db_session, async_session_maker
-from server_manager import server_manager, ServerManager
+from db import db, User, UserKey, Subscription, get_db_session, async_session_maker, read_session_maker, get_active_key_owner_and_uuid, init_db
+from server_manager import server_manager
 from bot_sync_integration import sync_on_action
 from sync_service import sync_service
 
-# Initialize server manager
-server_manager = ServerManager()
-
 # Set up logging
 logging.basicConfig(
     level=logging.INFO,
@@ -64,11 +61,15 @@ async def get_active_subscription(session: AsyncSession, user_id: int) -> Subscr
     )
     return result.scalar_one_or_none()
 
-async def init_db():
-    """Initialize database tables."""
-    from db import Base, engine
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+async def get_user_with_active_subscription(session: AsyncSession, user_id: int) -> Tuple[Optional[User], Optional[Subscription]]:
+    """Get user by telegram_id together with their active subscription, in one query."""
+    result = await session.execute(
+        select(User, Subscription)
+        .outerjoin(Subscription, and_(Subscription.user_id == User.id, Subscription.is_active == True))
+        .where(User.telegram_id == user_id)
+    )
+    row = result.first()
+    return (row[0], row[1]) if row else (None, None)
 
 # Helper functions
 async def check_subscription(user_id: int, channel_username: str) -> bool:
@@ -230,7 +231,7 @@ async def check_subscription_callback(callback: CallbackQuery):
                 user_uuid = str(uuid.uuid4())
                 
                 # Add user to Xray via gRPC
-                if not server_manager.add_vless_user(email=f"user_{user.id}@xray.com", uuid_str=user_uuid):
+                if not await server_manager.add_vless_user_async(email=f"user_{user.id}@xray.com", uuid_str=user_uuid):
                     await callback.answer("❌ Ошибка при настройке VPN. Пожалуйста, попробуйте позже.", show_alert=True)
                     return
                 
@@ -324,32 +325,18 @@ async def copy_vless_callback(callback: CallbackQuery):
     try:
         key_id = int(callback.data.split("_")[-1])
         
-        async with async_session_maker() as session:
-            # Get the user key
-            key_result = await session.execute(
-                select(UserKey).where(
-                    UserKey.id == key_id,
-                    UserKey.is_active == True
-                )
-            )
-            key = key_result.scalar_one_or_none()
+        async with read_session_maker() as session:
+            # Only the owner's id and the UUID are needed for the URL
+            key = await get_active_key_owner_and_uuid(session, key_id)
             
             if not key:
                 await callback.answer("❌ Ключ не найден или неактивен.", show_alert=True)
                 return
             
-            # Get user info
-            user_result = await session.execute(
-                select(User).where(User.id == key.user_id)
-            )
-            user = user_result.scalar_one_or_none()
-            
-            if not user:
-                await callback.answer("❌ Пользователь не найден.", show_alert=True)
-                return
+            user_id, key_uuid = key
             
             # Generate VLESS URL
-            vless_url = server_manager.generate_vless_url(f"user_{user.id}@xray.com", key.uuid)
+            vless_url = server_manager.generate_vless_url(f"user_{user_id}@xray.com", key_uuid)
             
             if not vless_url:
                 await callback.answer("❌ Ошибка при генерации VLESS URL.", show_alert=True)
@@ -374,7 +361,7 @@ async def stats_callback(callback: CallbackQuery):
     try:
         key_id = int(callback.data.split("_")[-1])
         
-        async with async_session_maker() as session:
+        async with read_session_maker() as session:
             # Get the user key
             key_result = await session.execute(
                 select(UserKey).where(
@@ -399,7 +386,7 @@ async def stats_callback(callback: CallbackQuery):
                 return
             
             # Get stats from Xray
-            stats = server_manager.xray.get_user_stats(f"user_{user.id}@xray.com")
+            stats = await server_manager.xray.get_user_stats_async(f"user_{user.id}@xray.com")
             
             if stats:
                 upload_gb = stats.get('upload', 0) / (1024**3)
@@ -462,7 +449,7 @@ async def renew_callback(callback: CallbackQuery):
                 return
             
             # Remove old user from Xray
-            server_manager.remove_vless_user(f"user_{user.id}@xray.com")
+            await server_manager.remove_vless_user_async(f"user_{user.id}@xray.com")
             
             # Log sync action
             logger.info(f"User {user.id} key renewal initiated")
@@ -471,7 +458,7 @@ async def renew_callback(callback: CallbackQuery):
             new_uuid = str(uuid.uuid4())
             
             # Add new user to Xray
-            if not server_manager.add_vless_user(f"user_{user.id}@xray.com", new_uuid):
+            if not await server_manager.add_vless_user_async(f"user_{user.id}@xray.com", new_uuid):
                 await callback.answer("❌ Ошибка при обновлении ключа.", show_alert=True)
                 return
             
@@ -512,7 +499,7 @@ async def copy_config_callback(callback: CallbackQuery):
         key_id = int(callback.data.replace("copy_config_", ""))
         user_id = callback.from_user.id
         
-        async with async_session_maker() as session:
+        async with read_session_maker() as session:
             # Get user's active subscription
             subscription = await get_active_subscription(session, user_id)
             if not subscription:
@@ -583,13 +570,12 @@ async def cmd_status(message: Message):
     user_id = message.from_user.id
     
     # Get user data from database
-    async with async_session_maker() as session:
-        user = await get_user(session, user_id)
+    async with read_session_maker() as session:
+        user, subscription = await get_user_with_active_subscription(session, user_id)
         if not user:
             await message.answer("❌ Пользователь не найден. Пожалуйста, начните с команды /start")
             return
             
-        subscription = await get_active_subscription(session, user_id)
         is_subscribed = await check_subscription(user_id, settings.CHANNEL_USERNAME)
     
     if not is_subscribed:
@@ -741,9 +727,9 @@ async def check_subscriptions():
             await session.commit()
             
             # Restart Xray to apply changes if needed
-            if hasattr(server_manager, 'restart_xray'):
+            if hasattr(server_manager, 'restart_xray_async'):
                 try:
-                    server_manager.restart_xray()
+                    await server_manager.restart_xray_async()
                 except Exception as e:
                     logger.error(f"Error restarting Xray: {e}")
             
@@ -753,7 +739,7 @@ async def check_subscriptions():
 async def check_xray_status():
     """Check Xray service status and restart if needed."""
     try:
-        status = server_manager.get_xray_status()
+        status = await server_manager.get_xray_status_async()
         logger.info(f"Xray status check result: {status}")
         
         # Check for errors first
@@ -797,16 +783,32 @@ def setup_scheduler():
         replace_existing=True
     )
     
-    # Full UUID synchronization every 5 minutes
+    # Push users changed by bot actions to Xray every few seconds
+    scheduler.add_job(
+        sync_service.flush_dirty,
+        'interval',
+        seconds=sync_service.flush_interval,
+        id='uuid_dirty_sync',
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True
+    )
+    
+    # Full UUID reconciliation every hour as a safety net
     scheduler.add_job(
         sync_service.full_sync,
         'interval',
-        minutes=5,
+        seconds=sync_service.sync_interval,
         id='uuid_full_sync',
         replace_existing=True
     )
 
 # Startup and shutdown
+@dp.shutdown()
+async def on_shutdown():
+    """Close Xray gRPC channels when polling stops."""
+    await server_manager.aclose()
+
 async def setup_bot():
     """Setup and start the bot."""
     max_retries = 5
@@ -26,13 +26,10 @@ def sync_on_action(action_type: str):
             elif args and hasattr(args[0], 'message') and hasattr(args[0].message, 'from_user'):
                 user_id = args[0].message.from_user.id
             
-            # Perform sync if user_id found
+            # Queue sync if user_id found; the sync service flushes it within seconds
             if user_id:
-                try:
-                    await sync_service.sync_user_on_action(user_id, action_type)
-                    logger.info(f"✅ Sync completed for user {user_id} on {action_type}")
-                except Exception as e:
-                    logger.error(f"❌ Sync failed for user {user_id} on {action_type}: {e}")
+                sync_service.mark_dirty(user_id, action_type)
+                logger.info(f"Sync queued for user {user_id} on {action_type}")
             
             return result
         return wrapper
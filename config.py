@@ -244,6 +244,7 @@ def generate_xray_config(users: list = None) -> dict:
 # Generate Reality keys if not set
 if not settings.XRAY_REALITY_PRIVKEY or not settings.XRAY_REALITY_PUBKEY:
     import subprocess
+    from reality_keys import PRIVKEY_OUTPUT_RE, PUBKEY_OUTPUT_RE
     try:
         # Try different possible xray binary locations
         xray_paths = ['/usr/local/bin/xray', '/usr/bin/xray', 'xray']
@@ -266,13 +267,13 @@ if not settings.XRAY_REALITY_PRIVKEY or not settings.XRAY_REALITY_PUBKEY:
                 timeout=10
             )
             if result.returncode == 0:
-                for line in result.stdout.split('\n'):
-                    if 'Private key' in line:
-                        private_key = line.split(':')[1].strip()
-                        settings.XRAY_REALITY_PRIVKEY = private_key
-                    elif 'Public key' in line:
-                        public_key = line.split(':')[1].strip()
-                        settings.XRAY_REALITY_PUBKEY = public_key
+                # Handles both "Private key/Public key" and "PrivateKey/Password" output
+                private_match = PRIVKEY_OUTPUT_RE.search(result.stdout)
+                public_match = PUBKEY_OUTPUT_RE.search(result.stdout)
+                if private_match:
+                    settings.XRAY_REALITY_PRIVKEY = private_match.group(1)
+                if public_match:
+                    settings.XRAY_REALITY_PUBKEY = public_match.group(1)
                 
                 # Save to .env file if not exists
                 env_file = Path(__file__).parent / '.env'
@@ -1,9 +1,11 @@
+import hashlib
 import logging
-from typing import Optional, List, Dict, Any, AsyncGenerator
+import os
+from typing import Optional, AsyncGenerator, Tuple
 from datetime import datetime, timedelta
-from sqlalchemy import select, update, delete, func, Column, Integer, String, DateTime, Boolean, ForeignKey, Text, BigInteger
+from sqlalchemy import event, select, update, delete, func, Column, Integer, String, DateTime, Boolean, ForeignKey, Text, BigInteger
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.orm import sessionmaker, selectinload, declarative_base, relationship, Session
+from sqlalchemy.orm import sessionmaker, selectinload, declarative_base, relationship
 from sqlalchemy.pool import NullPool
 
 from config import settings
@@ -180,6 +182,16 @@ async def get_active_key(session: AsyncSession, user_id: int) -> Optional[UserKe
     )
     return result.scalars().first()
 
+async def get_active_key_owner_and_uuid(session: AsyncSession, key_id: int) -> Optional[Tuple[int, str]]:
+    """Get owner's user id and UUID of an active key without loading UserKey/User objects"""
+    result = await session.execute(
+        select(User.id, UserKey.uuid)
+        .join(User, User.id == UserKey.user_id)
+        .where(UserKey.id == key_id)
+        .where(UserKey.is_active == True)
+    )
+    return result.first()
+
 # Subscription operations
 async def update_subscription_status(
     session: AsyncSession,
@@ -207,304 +219,6 @@ async def create_tables():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
-# Database operations
-class Database:
-    def __init__(self):
-        self.SessionLocal = SessionLocal
-    
-    def get_db(self) -> Session:
-        """Get a database session."""
-        db = self.SessionLocal()
-        try:
-            return db
-        except Exception as e:
-            logger.error(f"Error creating database session: {e}")
-            db.rollback()
-            raise
-    
-    def add_user(
-        self, 
-        user_id: int, 
-        username: str = None, 
-        first_name: str = None, 
-        last_name: str = None,
-        is_admin: bool = False
-    ) -> Optional[Dict[str, Any]]:
-        """Add a new user or update existing user."""
-        db = self.get_db()
-        try:
-            user = db.query(User).filter(User.user_id == user_id).first()
-            if user:
-                # Update existing user
-                if username is not None:
-                    user.username = username
-                if first_name is not None:
-                    user.first_name = first_name
-                if last_name is not None:
-                    user.last_name = last_name
-                if is_admin:
-                    user.is_admin = True
-            else:
-                # Create new user
-                user = User(
-                    user_id=user_id,
-                    username=username,
-                    first_name=first_name,
-                    last_name=last_name,
-                    is_admin=is_admin
-                )
-                db.add(user)
-            
-            db.commit()
-            db.refresh(user)
-            
-            # Return user data as dict
-            return {
-                'user_id': user.user_id,
-                'username': user.username,
-                'first_name': user.first_name,
-                'last_name': user.last_name,
-                'join_date': user.join_date,
-                'is_admin': user.is_admin
-            }
-        except Exception as e:
-            db.rollback()
-            logger.error(f"Error adding/updating user {user_id}: {e}")
-            return None
-        finally:
-            db.close()
-    
-    def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
-        """Get a user by ID."""
-        db = self.get_db()
-        try:
-            user = db.query(User).filter(User.user_id == user_id).first()
-            if user:
-                return {
-                    'user_id': user.user_id,
-                    'username': user.username,
-                    'first_name': user.first_name,
-                    'last_name': user.last_name,
-                    'join_date': user.join_date,
-                    'is_admin': user.is_admin
-                }
-            return None
-        except Exception as e:
-            logger.error(f"Error getting user {user_id}: {e}")
-            return None
-        finally:
-            db.close()
-    
-    def generate_key(
-        self, 
-        user_id: int, 
-        days_valid: int = 30, 
-        data_limit_gb: int = 1
-    ) -> Optional[Dict[str, Any]]:
-        """Generate a new Xray key for the user."""
-        db = self.get_db()
-        try:
-            # Deactivate any existing active keys
-            db.query(UserKey).filter(
-                UserKey.user_id == user_id,
-                UserKey.is_active == True
-            ).update({UserKey.is_active: False})
-            
-            # Create new key
-            key = UserKey(
-                user_id=user_id,
-                uuid=str(uuid.uuid4()),
-                is_active=True,
-                expires_at=datetime.utcnow() + timedelta(days=days_valid) if days_valid > 0 else None,
-                data_limit_bytes=data_limit_gb * 1024 * 1024 * 1024,
-                used_bytes=0
-            )
-            
-            db.add(key)
-            db.commit()
-            db.refresh(key)
-            
-            return {
-                'id': key.id,
-                'user_id': key.user_id,
-                'uuid': key.uuid,
-                'is_active': key.is_active,
-                'created_at': key.created_at,
-                'expires_at': key.expires_at,
-                'data_limit_bytes': key.data_limit_bytes,
-                'used_bytes': key.used_bytes
-            }
-        except Exception as e:
-            db.rollback()
-            logger.error(f"Error generating key for user {user_id}: {e}")
-            return None
-        finally:
-            db.close()
-    
-    def get_active_key(self, user_id: int) -> Optional[Dict[str, Any]]:
-        """Get the active key for a user."""
-        db = self.get_db()
-        try:
-            key = db.query(UserKey).filter(
-                UserKey.user_id == user_id,
-                UserKey.is_active == True
-            ).first()
-            
-            if key:
-                return {
-                    'id': key.id,
-                    'user_id': key.user_id,
-                    'uuid': key.uuid,
-                    'is_active': key.is_active,
-                    'created_at': key.created_at,
-                    'expires_at': key.expires_at,
-                    'data_limit_bytes': key.data_limit_bytes,
-                    'used_bytes': key.used_bytes
-                }
-            return None
-        except Exception as e:
-            logger.error(f"Error getting active key for user {user_id}: {e}")
-            return None
-        finally:
-            db.close()
-    
-    def revoke_key(self, key_id: int) -> bool:
-        """Revoke a key by ID."""
-        db = self.get_db()
-        try:
-            result = db.query(UserKey).filter(UserKey.id == key_id).update(
-                {UserKey.is_active: False}
-            )
-            db.commit()
-            return result > 0
-        except Exception as e:
-            db.rollback()
-            logger.error(f"Error revoking key {key_id}: {e}")
-            return False
-        finally:
-            db.close()
-    
-    def update_subscription_status(self, user_id: int, is_active: bool) -> bool:
-        """Update a user's subscription status."""
-        db = self.get_db()
-        try:
-            # Check if user exists
-            user = db.query(User).filter(User.user_id == user_id).first()
-            if not user:
-                logger.warning(f"User {user_id} not found when updating subscription")
-                return False
-                
-            # Update or create subscription
-            if user.subscription:
-                user.subscription.is_active = is_active
-                user.subscription.last_check = datetime.utcnow()
-            else:
-                subscription = Subscription(
-                    is_active=is_active,
-                    last_check=datetime.utcnow()
-                )
-                user.subscription = subscription
-            
-            db.commit()
-            return True
-        except Exception as e:
-            db.rollback()
-            logger.error(f"Error updating subscription for user {user_id}: {e}")
-            return False
-        finally:
-            db.close()
-    
-    def check_subscription(self, user_id: int) -> bool:
-        """Check if a user has an active subscription."""
-        db = self.get_db()
-        try:
-            user = db.query(User).filter(User.user_id == user_id).first()
-            if user and user.subscription:
-                return user.subscription.is_active
-            return False
-        except Exception as e:
-            logger.error(f"Error checking subscription for user {user_id}: {e}")
-            return False
-        finally:
-            db.close()
-    
-    def get_active_users(self) -> List[Dict[str, Any]]:
-        """Get all users with active subscriptions."""
-        db = self.get_db()
-        try:
-            users = db.query(User).join(Subscription).filter(
-                Subscription.is_active == True
-            ).all()
-            
-            return [
-                {
-                    'user_id': user.user_id,
-                    'username': user.username,
-                    'first_name': user.first_name,
-                    'last_name': user.last_name,
-                    'is_admin': user.is_admin,
-                    'join_date': user.join_date
-                }
-                for user in users
-            ]
-        except Exception as e:
-            logger.error(f"Error getting active users: {e}")
-            return []
-        finally:
-            db.close()
-
-    def update_user_traffic(self, user_id: int, used_bytes: int) -> bool:
-        """Update user's traffic usage."""
-        db = self.get_db()
-        try:
-            key = db.query(UserKey).filter(
-                UserKey.user_id == user_id,
-                UserKey.is_active == True
-            ).first()
-            
-            if key:
-                key.used_bytes = used_bytes
-                db.commit()
-                return True
-            return False
-        except Exception as e:
-            db.rollback()
-            logger.error(f"Error updating traffic for user {user_id}: {e}")
-            return False
-        finally:
-            db.close()
-            
-    def get_user_key_info(self, user_id: int) -> Optional[Dict[str, Any]]:
-        """Get user's key information including traffic usage."""
-        db = self.get_db()
-        try:
-            key = db.query(UserKey).filter(
-                UserKey.user_id == user_id,
-                UserKey.is_active == True
-            ).first()
-            
-            if not key:
-                return None
-                
-            user = db.query(User).filter(User.user_id == user_id).first()
-            if not user:
-                return None
-                
-            return {
-                'user_id': user.user_id,
-                'username': user.username,
-                'uuid': key.uuid,
-                'expires_at': key.expires_at,
-                'data_limit': key.data_limit_bytes,
-                'used_bytes': key.used_bytes,
-                'is_active': key.is_active
-            }
-        except Exception as e:
-            logger.error(f"Error getting user key info for user {user_id}: {e}")
-            return None
-        finally:
-            db.close()
-
 # Database setup
 DATABASE_URL = "sqlite+aiosqlite:///xray_bot.db"
 
@@ -540,10 +254,69 @@ async def get_db() -> AsyncSession:
             await session.rollback()
             raise
 
+# Read-only engine for pure lookups: no writer lock, no commit round-trip
+if engine.url.get_backend_name() == 'sqlite' and engine.url.database not in (None, '', ':memory:'):
+    read_engine = create_async_engine(
+        f"sqlite+aiosqlite:///file:{engine.url.database}?mode=ro&cache=shared&uri=true",
+        echo=True,
+        future=True
+    )
+    
+    @event.listens_for(read_engine.sync_engine, "connect")
+    def _set_read_only_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA query_only=1")
+        cursor.execute("PRAGMA read_uncommitted=1")
+        cursor.close()
+else:
+    read_engine = engine
+
+# Create read-only async session factory
+read_session_maker = async_sessionmaker(
+    bind=read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autoflush=False
+)
+
+# Dependency to get read-only DB session
+async def get_db_ro() -> AsyncGenerator[AsyncSession, None]:
+    async with read_session_maker() as session:
+        yield session
+
+def _schema_fingerprint() -> str:
+    """Stable hash of the declared tables and their columns."""
+    tables = sorted(
+        t.name + "(" + ",".join(f"{c.name} {c.type!r} {c.nullable}" for c in t.columns) + ")"
+        for t in Base.metadata.tables.values()
+    )
+    return hashlib.sha256("\n".join(tables).encode()).hexdigest()
+
+def _schema_marker_path() -> Optional[str]:
+    """Path of the schema marker stored next to a file-backed SQLite DB."""
+    database = engine.url.database
+    if engine.url.get_backend_name() != 'sqlite' or not database or database == ':memory:':
+        return None
+    return f"{database}.schema_sha"
+
 # Initialize database
 async def init_db():
+    """Create tables, skipping the per-table inspection when the schema is unchanged"""
+    fingerprint = _schema_fingerprint()
+    marker = _schema_marker_path()
+    
+    if marker and os.path.exists(engine.url.database) and os.path.exists(marker):
+        with open(marker) as f:
+            if f.read().strip() == fingerprint:
+                logger.debug("Database schema is up to date, skipping create_all")
+                return
+    
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    
+    if marker:
+        with open(marker, 'w') as f:
+            f.write(fingerprint)
 
 # Create a global database instance for backward compatibility
 class Database:
@@ -24,7 +24,7 @@ if ! command -v protoc &> /dev/null; then
 fi
 
 # Install required Python packages in venv
-pip install grpcio-tools
+pip install "grpcio-tools==1.60.0"  # keep in step with requirements.txt
 
 # Generate Python gRPC code from proto file
 python -m grpc_tools.protoc \
@@ -3,31 +3,22 @@
 Generate the correct public key for the private key in server config.
 """
 
-import subprocess
+import base64
 import sys
 
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+
 def get_public_key_from_private(private_key):
-    """Generate public key from private key using xray x25519 command."""
+    """Derive the Reality public key from a private key (X25519, in-process)."""
     try:
-        # Use xray x25519 -i with private key as argument
-        result = subprocess.run(
-            ["/usr/local/bin/xray", "x25519", "-i", private_key],
-            capture_output=True,
-            text=True
-        )
-        
-        if result.returncode != 0:
-            print(f"Error running xray x25519: {result.stderr}")
+        # Xray encodes keys as unpadded URL-safe base64
+        raw = base64.urlsafe_b64decode(private_key + "=" * (-len(private_key) % 4))
+        if len(raw) != 32:
+            print(f"Invalid private key length: {len(raw)} bytes (expected 32)")
             return None
         
-        # Parse the output to extract public key
-        lines = result.stdout.strip().split('\n')
-        for line in lines:
-            if 'Public key:' in line or 'PublicKey:' in line:
-                return line.split(':')[1].strip()
-        
-        print(f"Could not find public key in output: {result.stdout}")
-        return None
+        public_raw = X25519PrivateKey.from_private_bytes(raw).public_key().public_bytes_raw()
+        return base64.urlsafe_b64encode(public_raw).rstrip(b"=").decode()
         
     except Exception as e:
         print(f"Exception generating public key: {e}")
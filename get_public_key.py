@@ -1,37 +1,30 @@
 #!/usr/bin/env python3
+import base64
 import subprocess
 import re
 import os
 
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+
+from reality_keys import PRIVKEY_OUTPUT_RE, PUBKEY_OUTPUT_RE
+
+_PRIVKEY_LINE_RE = re.compile(r'^XRAY_REALITY_PRIVKEY=.*$', re.M)
+_PUBKEY_LINE_RE = re.compile(r'^XRAY_REALITY_PUBKEY=.*$', re.M)
+
 def get_public_key_from_private(private_key):
-    """Попытка получить публичный ключ из приватного через xray x25519"""
+    """Вычисление публичного ключа из приватного (X25519, без запуска xray)"""
     try:
-        # Попытка 1: передать приватный ключ через stdin
-        result = subprocess.run(
-            ['xray', 'x25519', '-i'],
-            input=private_key,
-            text=True,
-            capture_output=True,
-            timeout=10
-        )
-        
-        if result.returncode == 0:
-            # Парсим вывод
-            output = result.stdout
-            if 'Password:' in output:
-                public_key = re.search(r'Password:\s*(\S+)', output)
-                if public_key:
-                    return public_key.group(1).strip()
-            elif 'Public key:' in output:
-                public_key = re.search(r'Public key:\s*(\S+)', output)
-                if public_key:
-                    return public_key.group(1).strip()
+        # Xray кодирует ключи в URL-safe base64 без паддинга
+        raw = base64.urlsafe_b64decode(private_key + '=' * (-len(private_key) % 4))
+        if len(raw) != 32:
+            print(f"Неверная длина приватного ключа: {len(raw)} байт (ожидалось 32)")
+            return None
         
-        print(f"Ошибка при получении публичного ключа: {result.stderr}")
-        return None
+        public_raw = X25519PrivateKey.from_private_bytes(raw).public_key().public_bytes_raw()
+        return base64.urlsafe_b64encode(public_raw).rstrip(b'=').decode()
         
     except Exception as e:
-        print(f"Исключение при выполнении xray x25519: {e}")
+        print(f"Исключение при вычислении публичного ключа: {e}")
         return None
 
 def generate_new_keypair():
@@ -47,18 +40,12 @@ def generate_new_keypair():
         if result.returncode == 0:
             output = result.stdout
             
-            # Парсинг для нового формата (PrivateKey/Password)
-            private_match = re.search(r'PrivateKey:\s*(\S+)', output)
-            public_match = re.search(r'Password:\s*(\S+)', output)
-            
-            # Парсинг для старого формата (Private key/Public key)
-            if not private_match:
-                private_match = re.search(r'Private key:\s*(\S+)', output)
-            if not public_match:
-                public_match = re.search(r'Public key:\s*(\S+)', output)
+            # Оба формата вывода: PrivateKey/Password и Private key/Public key
+            private_match = PRIVKEY_OUTPUT_RE.search(output)
+            public_match = PUBKEY_OUTPUT_RE.search(output)
             
             if private_match and public_match:
-                return private_match.group(1).strip(), public_match.group(1).strip()
+                return private_match.group(1), public_match.group(1)
         
         print(f"Ошибка при генерации новых ключей: {result.stderr}")
         return None, None
@@ -74,11 +61,23 @@ def update_env_file(private_key, public_key):
             content = f.read()
         
         # Обновляем ключи
-        content = re.sub(r'XRAY_REALITY_PRIVKEY=.*', f'XRAY_REALITY_PRIVKEY={private_key}', content)
-        content = re.sub(r'XRAY_REALITY_PUBKEY=.*', f'XRAY_REALITY_PUBKEY={public_key}', content)
+        content = _PRIVKEY_LINE_RE.sub(f'XRAY_REALITY_PRIVKEY={private_key}', content)
+        content = _PUBKEY_LINE_RE.sub(f'XRAY_REALITY_PUBKEY={public_key}', content)
         
-        with open('.env', 'w') as f:
-            f.write(content)
+        # Пишем во временный файл и атомарно подменяем .env.
+        # Права берём у текущего .env (там токен бота и приватный ключ), и выставляем
+        # их до записи, чтобы ключи ни на миг не оказались в файле с правами по umask
+        mode = os.stat('.env').st_mode & 0o7777
+        fd = os.open('.env.tmp', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.fchmod(fd, mode)
+            payload = memoryview(content.encode())
+            while payload:
+                payload = payload[os.write(fd, payload):]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace('.env.tmp', '.env')
         
         print("✓ .env файл обновлен")
         return True
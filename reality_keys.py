@@ -0,0 +1,6 @@
+"""Parsing of `xray x25519` output, shared by config.py and get_public_key.py."""
+import re
+
+# Old output format is "Private key/Public key", newer Xray prints "PrivateKey/Password"
+PRIVKEY_OUTPUT_RE = re.compile(r'^\s*(?:Private key|PrivateKey):\s*(\S+)\s*$', re.M)
+PUBKEY_OUTPUT_RE = re.compile(r'^\s*(?:Public key|PublicKey|Password):\s*(\S+)\s*$', re.M)
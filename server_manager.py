@@ -1,23 +1,231 @@
+import asyncio
 import os
 import logging
 import json
+import shutil
 import subprocess
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Set, Tuple
 from pathlib import Path
-import grpc
 import time
 import uuid
 import base64
-from typing import Optional, Dict, List, Tuple
-import logging
+from collections import deque
 from datetime import datetime, timedelta
+from functools import lru_cache
 from urllib.parse import quote
 
 from config import settings, generate_xray_config
-from xray_grpc import get_xray_client
+
+try:
+    import orjson
+except ImportError:  # Optional: faster config serialization
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+XRAY_INSTALL_SCRIPT_URL = "https://github.com/XTLS/Xray-install/raw/main/install-release.sh"
+XRAY_ERROR_LOG = "/var/log/xray/error.log"
+# Status polls (bot UI, scheduler, scripts) within this window share one probe
+XRAY_STATUS_TTL = 5.0
+# Upper bound on waiting for a systemd restart job queued over D-Bus
+RESTART_JOB_TIMEOUT = 30.0
+XRAY_NOT_INSTALLED_ERROR = 'Xray is not installed (not found at /usr/local/bin/xray or in PATH)'
+
+
+def _cache_lookup(cache: Dict[str, Tuple[float, Any]], key: str, ttl: float) -> Optional[Any]:
+    """Return the cached value for key if it is younger than ttl seconds."""
+    if ttl <= 0:
+        return None
+    entry = cache.get(key)
+    if entry is not None and time.monotonic() - entry[0] < ttl:
+        return entry[1]
+    return None
+
+
+def _cache_store(cache: Dict[str, Tuple[float, Any]], key: str, value: Any) -> Any:
+    """Store value under key, stamped after the underlying call completed."""
+    cache[key] = (time.monotonic(), value)
+    return value
+
+
+# VLESS Reality URL, filled from a _reality_config() dict
+_VLESS_URL_TEMPLATE = (
+    "vless://%(id)s@%(add)s:%(port)s"
+    "?encryption=none&security=%(tls)s"
+    "&sni=%(sni)s&fp=%(fp)s&pbk=%(pbk)s"
+    "&sid=%(sid)s&type=%(net)s"
+    "#%(ps)s"
+)
+
+
+@lru_cache(maxsize=4096)
+def _reality_config(email: str, user_id: str, server_ip: str, port: int,
+                    sni: str, public_key: str, short_id: str) -> Dict[str, Any]:
+    """Build the VLESS Reality client config; cached on every input, so a settings change misses."""
+    return {
+        "v": "2",
+        "ps": f"Xray Reality - {email}",
+        "add": server_ip,
+        "port": port,
+        "id": user_id,
+        "aid": "0",
+        "scy": "auto",
+        "net": "tcp",
+        "type": "none",
+        "host": "",
+        "path": "",
+        "tls": "reality",
+        "sni": sni,
+        "alpn": "",
+        "fp": "chrome",
+        "pbk": public_key,
+        "sid": short_id,
+        "spx": ""
+    }
+
+
+@lru_cache(maxsize=4096)
+def _vless_url(email: str, user_id: str, server_ip: str, port: int,
+               sni: str, public_key: str, short_id: str) -> str:
+    """Build the VLESS Reality URL (without flow parameter) for a user."""
+    return _VLESS_URL_TEMPLATE % _reality_config(email, user_id, server_ip, port, sni, public_key, short_id)
+
+
+def _with_total(user_stats: Optional[Dict]) -> Optional[Dict]:
+    """Add the combined total to one user's {upload, download} traffic counters."""
+    if user_stats is None:
+        return None
+    # get_traffic_stats always fills both directions
+    upload, download = user_stats['upload'], user_stats['download']
+    return {
+        'upload': upload,
+        'download': download,
+        'total': upload + download
+    }
+
+
+def clear_reality_caches():
+    """Drop cached client configs and URLs, e.g. after Reality keys are rotated.
+    
+    Entries are keyed on the settings values, so stale ones are never served;
+    this only frees the memory they hold.
+    """
+    _reality_config.cache_clear()
+    _vless_url.cache_clear()
+
+
+def _run_command(args: List[str]) -> subprocess.CompletedProcess:
+    """Run a command given by absolute path and capture its text output.
+    
+    With an absolute executable and close_fds=False (our own fds are already
+    non-inheritable) CPython launches the child via posix_spawn instead of
+    fork+exec, which matters for a bot process with a large RSS.
+    """
+    return subprocess.run(args, capture_output=True, text=True, close_fds=False)
+
+
+async def _run_command_async(args: List[str]) -> Tuple[int, str, str]:
+    """Run a command without blocking the event loop.
+    
+    Returns:
+        Tuple[int, str, str]: Exit code, decoded stdout and decoded stderr
+    """
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        close_fds=False
+    )
+    stdout, stderr = await process.communicate()
+    return process.returncode, stdout.decode(errors='replace'), stderr.decode(errors='replace')
+
+
+def _journal_tail(unit: str, lines: int) -> Optional[str]:
+    """Read the last lines a systemd unit logged, straight from the journal.
+    
+    Returns:
+        Optional[str]: The log text, or None if python-systemd is not installed.
+    """
+    try:
+        from systemd import journal
+    except ImportError:
+        return None
+    
+    reader = journal.Reader()
+    try:
+        reader.add_match(_SYSTEMD_UNIT=unit)
+        reader.seek_tail()
+        tail = deque(maxlen=lines)
+        for _ in range(lines):
+            entry = reader.get_previous()
+            if not entry:
+                break
+            tail.appendleft(str(entry.get('MESSAGE', '')))
+        return "\n".join(tail)
+    finally:
+        reader.close()
+
+
+# `xray -version` output keyed by binary path and mtime, so a reinstall is picked up
+_xray_versions: Dict[Tuple[str, int], str] = {}
+
+
+def _xray_version_key(xray_path: str) -> Tuple[str, int]:
+    """Cache key for the version of the xray binary at xray_path."""
+    return (xray_path, os.stat(xray_path).st_mtime_ns)
+
+
+def _cached_xray_version(xray_path: str) -> Tuple[Tuple[str, int], Optional[str]]:
+    """Look up the memoized version of the xray binary at xray_path.
+    
+    Returns:
+        Tuple: The cache key and the version, or None if `xray -version` still has to run
+    """
+    version_key = _xray_version_key(xray_path)
+    return version_key, _xray_versions.get(version_key)
+
+
+def _remember_xray_version(version_key: Tuple[str, int], returncode: int, stdout: str) -> Optional[str]:
+    """Memoize the first line of `xray -version` output; None if the command failed."""
+    if returncode != 0:
+        return None
+    version = _xray_versions[version_key] = stdout.split('\n')[0]
+    return version
+
+
+def _systemctl_args(action: str) -> List[str]:
+    """systemctl command line for an action on the Xray unit."""
+    return ["/usr/bin/systemctl", action, settings.XRAY_SERVICE]
+
+
+def _reports_active(returncode: int, stdout: str) -> bool:
+    """Interpret the result of `systemctl is-active`."""
+    return returncode == 0 and stdout.strip() == "active"
+
+
+def _new_xray_status() -> Dict[str, Any]:
+    """Empty Xray status snapshot, filled in by the status probes."""
+    return {
+        'installed': False,
+        'running': False,
+        'version': None,
+        'error': None
+    }
+
+
+def _encode_config(config: Dict[str, Any]) -> bytes:
+    """Serialize an Xray config to compact JSON bytes, with orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(config)
+    return json.dumps(config, separators=(',', ':')).encode()
+
+
+def _find_xray() -> Optional[str]:
+    """Locate the xray binary: default install path first, then PATH."""
+    xray_path = shutil.which("/usr/local/bin/xray") or shutil.which("xray")
+    return os.path.abspath(xray_path) if xray_path else None
+
+
 class XrayManager:
     """Manages Xray server operations using gRPC API."""
     
@@ -28,7 +236,21 @@ class XrayManager:
             grpc_address: Address of the Xray gRPC API (default: 127.0.0.1:50051)
         """
         self.grpc_address = grpc_address
-        self.xray_client = get_xray_client()
+        self._xray_client = None
+        self._status_cache: Dict[str, Tuple[float, Any]] = {}
+        self._systemd = None  # pystemd Unit once loaded, False if D-Bus is unavailable
+    
+    @property
+    def xray_client(self):
+        """The shared Xray gRPC client, imported on first use.
+        
+        grpc and the protobuf modules are only loaded once something actually
+        talks to Xray, so bot commands that never do skip that import cost.
+        """
+        if self._xray_client is None:
+            from xray_grpc import get_xray_client
+            self._xray_client = get_xray_client()
+        return self._xray_client
     
     def connect(self) -> bool:
         """Establish connection to Xray gRPC API.
@@ -40,7 +262,13 @@ class XrayManager:
     
     def close(self):
         """Close the gRPC channel."""
-        self.xray_client.close()
+        if self._xray_client is not None:
+            self._xray_client.close()
+    
+    async def aclose(self):
+        """Close the gRPC channels, including the asyncio one."""
+        if self._xray_client is not None:
+            await self._xray_client.aclose()
     
     def __enter__(self):
         self.connect()
@@ -62,6 +290,42 @@ class XrayManager:
         """
         return self.xray_client.add_user(email, uuid_str, level)
     
+    def add_users(self, users: List[Tuple[str, str]], level: int = 0) -> List[bool]:
+        """Add several users at once, issuing the RPCs concurrently.
+        
+        Args:
+            users: (email, uuid) pairs
+            level: User level (default: 0)
+            
+        Returns:
+            List[bool]: Per-user result, in the order of ``users``
+        """
+        return self.xray_client.add_users(users, level)
+    
+    async def add_user_async(self, email: str, uuid_str: str, level: int = 0) -> bool:
+        """Add a new user to Xray using the asyncio gRPC API.
+        
+        Args:
+            email: User's email (used as identifier)
+            uuid_str: User's UUID
+            level: User level (default: 0)
+            
+        Returns:
+            bool: True if user was added successfully, False otherwise.
+        """
+        return await self.xray_client.add_user_async(email, uuid_str, level)
+    
+    async def remove_user_async(self, email: str) -> bool:
+        """Remove a user from Xray using the asyncio gRPC API.
+        
+        Args:
+            email: User's email to remove
+            
+        Returns:
+            bool: True if user was removed successfully, False otherwise.
+        """
+        return await self.xray_client.remove_user_async(email)
+    
     def remove_user(self, email: str) -> bool:
         """Remove a user from Xray using gRPC API.
         
@@ -84,26 +348,160 @@ class XrayManager:
             Optional[Dict]: User statistics or None if failed
         """
         try:
-            stats = self.xray_client.get_traffic_stats(email, reset)
-            if email in stats:
-                user_stats = stats[email]
-                return {
-                    'upload': user_stats.get('upload', 0),
-                    'download': user_stats.get('download', 0),
-                    'total': user_stats.get('upload', 0) + user_stats.get('download', 0)
-                }
+            user_stats = self.xray_client.get_traffic_stats(email, reset).get(email)
+            return _with_total(user_stats)
+        except Exception as e:
+            logger.error(f"Error getting stats for {email}: {e}")
             return None
+    
+    async def get_user_stats_async(self, email: str, reset: bool = False) -> Optional[Dict]:
+        """Get user statistics using the asyncio gRPC API.
+        
+        Args:
+            email: User's email
+            reset: Whether to reset the stats after retrieval
+            
+        Returns:
+            Optional[Dict]: User statistics or None if failed
+        """
+        try:
+            user_stats = (await self.xray_client.get_traffic_stats_async(email, reset)).get(email)
+            return _with_total(user_stats)
         except Exception as e:
             logger.error(f"Error getting stats for {email}: {e}")
             return None
     
-    def get_system_stats(self) -> Optional[Dict]:
+    def get_user_emails(self) -> Set[str]:
+        """Get emails of users Xray currently reports traffic counters for.
+        
+        Returns:
+            Set[str]: User emails, from a single QueryStats call.
+        """
+        try:
+            return set(self.xray_client.get_traffic_stats())
+        except Exception as e:
+            logger.error(f"Error listing Xray users: {e}")
+            return set()
+    
+    def get_system_stats(self, ttl: float = 0.0) -> Optional[Dict]:
         """Get Xray system statistics.
         
+        Args:
+            ttl: Return a cached snapshot if it is younger than this many seconds
+        
         Returns:
             Optional[Dict]: System statistics or None if failed
         """
-        return self.xray_client.get_system_stats()
+        cached = _cache_lookup(self._status_cache, 'system_stats', ttl)
+        if cached is not None:
+            return cached
+        return _cache_store(self._status_cache, 'system_stats', self.xray_client.get_system_stats())
+    
+    def _systemd_unit(self):
+        """Get the Xray systemd unit over D-Bus.
+        
+        Returns:
+            The loaded pystemd unit, or None if pystemd/D-Bus is unavailable.
+        """
+        if self._systemd is None:
+            try:
+                from pystemd.systemd1 import Unit
+                
+                unit = Unit(f"{settings.XRAY_SERVICE}.service".encode())
+                unit.load()
+                self._systemd = unit
+            except Exception as e:
+                logger.debug(f"systemd D-Bus API unavailable, falling back to systemctl: {e}")
+                self._systemd = False
+        return self._systemd or None
+    
+    def _is_service_active(self) -> bool:
+        """Check whether the Xray systemd unit is active."""
+        unit = self._systemd_unit()
+        if unit is not None:
+            return unit.Unit.ActiveState == b'active'
+        
+        result = _run_command(_systemctl_args("is-active"))
+        return _reports_active(result.returncode, result.stdout)
+    
+    def _wait_for_api(self, timeout: float = 2.0) -> bool:
+        """Wait until the Xray gRPC API accepts connections.
+        
+        Args:
+            timeout: Maximum time to wait, in seconds
+            
+        Returns:
+            bool: True if the API became ready in time, False otherwise.
+        """
+        import grpc
+        
+        channel = grpc.insecure_channel(self.grpc_address)
+        try:
+            grpc.channel_ready_future(channel).result(timeout=timeout)
+            return True
+        except grpc.FutureTimeoutError:
+            return False
+        finally:
+            channel.close()
+    
+    async def _wait_for_api_async(self, timeout: float = 2.0) -> bool:
+        """Wait until the Xray gRPC API accepts connections, without blocking the event loop.
+        
+        Args:
+            timeout: Maximum time to wait, in seconds
+            
+        Returns:
+            bool: True if the API became ready in time, False otherwise.
+        """
+        import grpc
+        
+        channel = grpc.aio.insecure_channel(self.grpc_address)
+        try:
+            await asyncio.wait_for(channel.channel_ready(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            await channel.close()
+    
+    def _start_restart_job(self, unit) -> Tuple[bytes, float]:
+        """Queue a restart of the Xray unit over D-Bus.
+        
+        Unit.Restart only queues a job and returns its path; systemctl restart
+        blocks until that job is removed, so callers poll _restart_job_result
+        before probing the API.
+        
+        Returns:
+            Tuple[bytes, float]: The job path and the monotonic deadline for it to finish
+        """
+        return unit.Unit.Restart(b'replace'), time.monotonic() + RESTART_JOB_TIMEOUT
+    
+    def _restart_job_result(self, unit, job_path: bytes, deadline: float) -> Optional[bool]:
+        """Check on a restart job queued by _start_restart_job.
+        
+        Returns:
+            Optional[bool]: None while the job is still queued, otherwise True if
+            the unit came back active and False if it did not or the deadline passed.
+        """
+        # Unit.Job is (id, path) of the pending job, or (0, b'/') once none is queued
+        if unit.Unit.Job[1] == job_path:
+            if time.monotonic() < deadline:
+                return None
+            logger.error(f"Xray restart job did not finish within {RESTART_JOB_TIMEOUT:.0f}s")
+            return False
+        
+        state = unit.Unit.ActiveState
+        if state != b'active':
+            logger.error(f"Failed to restart Xray: unit is {state.decode()} after restart")
+            return False
+        return True
+    
+    def _restart_command_ok(self, returncode: int, stderr: str) -> bool:
+        """Check the result of `systemctl restart`, logging its error output on failure."""
+        if returncode != 0:
+            logger.error(f"Failed to restart Xray: {stderr}")
+            return False
+        return True
     
     def restart_xray(self) -> bool:
         """Restart Xray service.
@@ -112,75 +510,166 @@ class XrayManager:
             bool: True if restart was successful, False otherwise.
         """
         try:
-            result = subprocess.run(
-                ["/usr/bin/systemctl", "restart", settings.XRAY_SERVICE],
-                capture_output=True,
-                text=True
-            )
+            unit = self._systemd_unit()
+            if unit is not None:
+                job = self._start_restart_job(unit)
+                restarted = self._restart_job_result(unit, *job)
+                while restarted is None:
+                    time.sleep(0.1)
+                    restarted = self._restart_job_result(unit, *job)
+            else:
+                result = _run_command(_systemctl_args("restart"))
+                restarted = self._restart_command_ok(result.returncode, result.stderr)
+            if not restarted:
+                return False
+                
+            # The old process is gone now; return as soon as the new one accepts
+            # connections instead of sleeping blindly
+            if not self._wait_for_api():
+                logger.warning("Xray API did not become ready within 2s after restart")
+            return True
             
-            if result.returncode != 0:
-                logger.error(f"Failed to restart Xray: {result.stderr}")
+        except Exception as e:
+            logger.error(f"Error restarting Xray: {e}")
+            return False
+        finally:
+            # Dropped only once the restart is over, so a poll made while it was
+            # still in progress can't leave a stale snapshot cached
+            self._status_cache.pop('xray_status', None)
+    
+    async def restart_xray_async(self) -> bool:
+        """Restart Xray service without blocking the event loop.
+        
+        Returns:
+            bool: True if restart was successful, False otherwise.
+        """
+        try:
+            unit = self._systemd_unit()
+            if unit is not None:
+                job = self._start_restart_job(unit)
+                restarted = self._restart_job_result(unit, *job)
+                while restarted is None:
+                    await asyncio.sleep(0.1)
+                    restarted = self._restart_job_result(unit, *job)
+            else:
+                returncode, _, stderr = await _run_command_async(_systemctl_args("restart"))
+                restarted = self._restart_command_ok(returncode, stderr)
+            if not restarted:
                 return False
                 
-            # Wait a bit for Xray to restart
-            time.sleep(2)
+            if not await self._wait_for_api_async():
+                logger.warning("Xray API did not become ready within 2s after restart")
             return True
             
         except Exception as e:
             logger.error(f"Error restarting Xray: {e}")
             return False
+        finally:
+            self._status_cache.pop('xray_status', None)
     
-    def get_xray_status(self) -> Dict:
+    def get_xray_status(self, ttl: float = XRAY_STATUS_TTL) -> Dict:
         """Get Xray service status.
         
+        Args:
+            ttl: Return a cached snapshot if it is younger than this many seconds
+        
         Returns:
             Dict: Status information
         """
-        status = {
-            'installed': False,
-            'running': False,
-            'version': None,
-            'error': None
-        }
+        cached = _cache_lookup(self._status_cache, 'xray_status', ttl)
+        if cached is not None:
+            return dict(cached)
+        
+        status = _new_xray_status()
         
         try:
-            # Check if Xray is installed at the correct path
-            xray_path = "/usr/local/bin/xray"
-            if not os.path.exists(xray_path):
-                status['error'] = f'Xray is not installed at {xray_path}'
+            xray_path = _find_xray()
+            if not xray_path:
+                status['error'] = XRAY_NOT_INSTALLED_ERROR
                 return status
             
-            # Get Xray version
-            result = subprocess.run(
-                [xray_path, "-version"],
-                capture_output=True,
-                text=True
-            )
+            # Get Xray version (only changes when the binary is replaced)
+            version_key, version = _cached_xray_version(xray_path)
+            if version is None:
+                result = _run_command([xray_path, "-version"])
+                version = _remember_xray_version(version_key, result.returncode, result.stdout)
             
-            if result.returncode == 0:
-                status['version'] = result.stdout.split('\n')[0]
+            if version is not None:
+                status['version'] = version
                 status['installed'] = True
             
             # Check if Xray service is running
-            result = subprocess.run(
-                ["/usr/bin/systemctl", "is-active", settings.XRAY_SERVICE],
-                capture_output=True,
-                text=True
-            )
+            status['running'] = self._is_service_active()
+            
+            _cache_store(self._status_cache, 'xray_status', dict(status))
+            return status
+            
+        except Exception as e:
+            status['error'] = str(e)
+            return status
+    
+    async def get_xray_status_async(self, ttl: float = XRAY_STATUS_TTL) -> Dict:
+        """Get Xray service status, running the version and service probes concurrently.
+        
+        Args:
+            ttl: Return a cached snapshot if it is younger than this many seconds
+        
+        Returns:
+            Dict: Status information
+        """
+        cached = _cache_lookup(self._status_cache, 'xray_status', ttl)
+        if cached is not None:
+            return dict(cached)
+        
+        status = _new_xray_status()
+        
+        try:
+            xray_path = _find_xray()
+            if not xray_path:
+                status['error'] = XRAY_NOT_INSTALLED_ERROR
+                return status
+            
+            async def probe_version() -> Optional[str]:
+                version_key, version = _cached_xray_version(xray_path)
+                if version is None:
+                    returncode, stdout, _ = await _run_command_async([xray_path, "-version"])
+                    version = _remember_xray_version(version_key, returncode, stdout)
+                return version
             
-            if result.returncode == 0 and result.stdout.strip() == "active":
-                status['running'] = True
+            async def probe_running() -> bool:
+                if self._systemd_unit() is not None:
+                    return self._is_service_active()
+                returncode, stdout, _ = await _run_command_async(_systemctl_args("is-active"))
+                return _reports_active(returncode, stdout)
             
+            version, status['running'] = await asyncio.gather(probe_version(), probe_running())
+            if version is not None:
+                status['version'] = version
+                status['installed'] = True
+            
+            _cache_store(self._status_cache, 'xray_status', dict(status))
             return status
             
         except Exception as e:
             status['error'] = str(e)
             return status
 
-
 class ServerManager:
     """Handles server management operations including Xray installation and configuration."""
     
+    _instance: Optional["ServerManager"] = None
+    
+    @classmethod
+    def get_instance(cls) -> "ServerManager":
+        """Get the shared server manager, creating it on first use.
+        
+        Returns:
+            ServerManager: The process-wide instance.
+        """
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+    
     def __init__(self, grpc_address: str = '127.0.0.1:50051'):
         """Initialize the server manager.
         
@@ -189,6 +678,7 @@ class ServerManager:
         """
         self.grpc_address = grpc_address
         self.xray = XrayManager(grpc_address)
+        self._status_cache: Dict[str, Tuple[float, Any]] = {}
     
     def install_xray(self) -> bool:
         """Install Xray on the server.
@@ -197,22 +687,39 @@ class ServerManager:
             bool: True if installation was successful, False otherwise.
         """
         try:
-            # Install Xray using the official installation script
-            install_cmd = "bash -c \"$(curl -L https://github.com/XTLS/Xray-install/raw/main/install-release.sh)\""
-            
-            result = subprocess.run(
-                install_cmd, 
-                shell=True, 
-                capture_output=True, 
-                text=True
+            # Stream the official installation script straight into bash (curl | bash -s --)
+            curl = subprocess.Popen(
+                ["/usr/bin/curl", "--fail", "--silent", "--show-error", "--location", XRAY_INSTALL_SCRIPT_URL],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                close_fds=False
+            )
+            bash = subprocess.Popen(
+                ["/bin/bash", "-s", "--"],
+                stdin=curl.stdout,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                close_fds=False
             )
+            curl.stdout.close()  # bash owns the read end now
+            
+            stdout, stderr = bash.communicate()
+            curl_stderr = curl.stderr.read().decode(errors='replace')
+            curl.stderr.close()
+            curl.wait()
+            
+            # An aborted download gives bash an empty script, which "succeeds"
+            if curl.returncode != 0:
+                logger.error(f"Failed to download Xray install script: {curl_stderr}")
+                return False
             
-            if result.returncode != 0:
-                logger.error(f"Failed to install Xray: {result.stderr}")
+            if bash.returncode != 0:
+                logger.error(f"Failed to install Xray: {stderr}")
                 return False
             
             logger.info("Xray installed successfully")
-            logger.debug(f"Installation output: {result.stdout}")
+            logger.debug(f"Installation output: {stdout}")
             return True
             
         except Exception as e:
@@ -234,23 +741,31 @@ class ServerManager:
             # Create config directory if it doesn't exist
             os.makedirs(settings.XRAY_CONFIG_DIR, exist_ok=True)
             
-            # Write config file
+            # Write config atomically: temp file with proper permissions, fsync, rename.
+            # An interrupted write can no longer leave Xray with a truncated config.
             config_path = settings.XRAY_CONFIG_FILE
-            with open(config_path, 'w') as f:
-                json.dump(config, f, indent=2)
+            tmp_path = f"{config_path}.tmp"
+            payload = memoryview(_encode_config(config))
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            try:
+                while payload:
+                    payload = payload[os.write(fd, payload):]
+                os.fchmod(fd, 0o600)
+                os.fchown(fd, 0, 0)  # root:root
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            os.replace(tmp_path, config_path)
             
-            # Set proper permissions
-            os.chmod(config_path, 0o600)
-            os.chown(config_path, 0, 0)  # root:root
-            
-            # Create log directory
+            # Create log directory; one open per log file, then permissions via the fd
             os.makedirs("/var/log/xray", exist_ok=True)
             for log_file in ["access.log", "error.log"]:
-                log_path = f"/var/log/xray/{log_file}"
-                if not os.path.exists(log_path):
-                    open(log_path, 'a').close()
-                os.chmod(log_path, 0o600)
-                os.chown(log_path, 0, 0)
+                fd = os.open(f"/var/log/xray/{log_file}", os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+                try:
+                    os.fchmod(fd, 0o600)
+                    os.fchown(fd, 0, 0)  # root:root
+                finally:
+                    os.close(fd)
             
             logger.info("Xray configuration updated successfully")
             return True
@@ -259,6 +774,17 @@ class ServerManager:
             logger.error(f"Error configuring Xray: {e}")
             return False
     
+    async def configure_xray_async(self, config: Dict) -> bool:
+        """Configure Xray without blocking the event loop on disk I/O.
+        
+        Args:
+            config: Dictionary containing Xray configuration.
+            
+        Returns:
+            bool: True if configuration was successful, False otherwise.
+        """
+        return await asyncio.to_thread(self.configure_xray, config)
+    
     def restart_xray(self) -> bool:
         """Restart the Xray service.
         
@@ -267,30 +793,77 @@ class ServerManager:
         """
         return self.xray.restart_xray()
     
-    def get_xray_status(self) -> Dict:
+    async def restart_xray_async(self) -> bool:
+        """Restart the Xray service without blocking the event loop.
+        
+        Returns:
+            bool: True if restart was successful, False otherwise.
+        """
+        return await self.xray.restart_xray_async()
+    
+    def get_xray_status(self, ttl: float = XRAY_STATUS_TTL) -> Dict:
         """Get the status of the Xray service.
         
+        Args:
+            ttl: Return a cached snapshot if it is younger than this many seconds.
+        
         Returns:
             Dict: Status information.
         """
-        return self.xray.get_xray_status()
+        return self.xray.get_xray_status(ttl)
     
-    def get_xray_logs(self, lines: int = 50) -> str:
+    async def get_xray_status_async(self, ttl: float = XRAY_STATUS_TTL) -> Dict:
+        """Get the status of the Xray service without blocking the event loop.
+        
+        Args:
+            ttl: Return a cached snapshot if it is younger than this many seconds.
+        
+        Returns:
+            Dict: Status information.
+        """
+        return await self.xray.get_xray_status_async(ttl)
+    
+    def get_xray_logs(self, lines: int = 50, ttl: float = 0.0) -> str:
         """Get the last N lines of Xray logs.
         
         Args:
             lines: Number of lines to retrieve.
+            ttl: Return a cached snapshot if it is younger than this many seconds.
             
         Returns:
             str: The log content.
         """
+        cache_key = f'xray_logs:{lines}'
+        cached = _cache_lookup(self._status_cache, cache_key, ttl)
+        if cached is not None:
+            return cached
+        
         try:
-            result = subprocess.run(
-                ["/usr/bin/journalctl", "-u", settings.XRAY_SERVICE, "-n", str(lines), "--no-pager"],
-                capture_output=True,
-                text=True
-            )
-            return result.stdout if result.returncode == 0 else result.stderr
+            # Tail Xray's own error log: no journalctl process, no journal decoding
+            with open(XRAY_ERROR_LOG, 'rb') as f:
+                size = f.seek(0, os.SEEK_END)
+                window = lines * 256
+                while True:
+                    start = max(0, size - window)
+                    f.seek(start)
+                    if start:
+                        f.readline()  # skip the partial first line
+                    tail = deque(f, maxlen=lines)
+                    if len(tail) >= lines or start == 0:
+                        break
+                    window *= 4
+            
+            return _cache_store(self._status_cache, cache_key, b"".join(tail).decode('utf-8', 'replace'))
+            
+        except FileNotFoundError as e:
+            # No log file configured: Xray's output only goes to the journal
+            try:
+                journal_tail = _journal_tail(f"{settings.XRAY_SERVICE}.service", lines)
+            except Exception as journal_error:
+                return f"Error retrieving logs: {journal_error}"
+            if journal_tail is None:
+                return f"Error retrieving logs: {e}"
+            return _cache_store(self._status_cache, cache_key, journal_tail)
                 
         except Exception as e:
             return f"Error retrieving logs: {e}"
@@ -306,11 +879,6 @@ class ServerManager:
             bool: True if user was added successfully, False otherwise.
         """
         try:
-            # Ensure connection is established
-            if not self.xray.connect():
-                logger.error("Failed to connect to Xray gRPC API")
-                return False
-            
             result = self.xray.add_user(email, uuid_str)
             if result:
                 logger.info(f"Successfully added VLESS user {email} with UUID {uuid_str}")
@@ -333,11 +901,6 @@ class ServerManager:
             bool: True if user was removed successfully, False otherwise.
         """
         try:
-            # Ensure connection is established
-            if not self.xray.connect():
-                logger.error("Failed to connect to Xray gRPC API")
-                return False
-            
             result = self.xray.remove_user(email)
             if result:
                 logger.info(f"Successfully removed VLESS user {email}")
@@ -350,60 +913,92 @@ class ServerManager:
             logger.error(f"Error removing VLESS user {email}: {e}")
             return False
     
-    def get_system_stats(self) -> Dict[str, Any]:
-        """Get system statistics from Xray."""
-        return self.xray.get_system_stats() if hasattr(self.xray, 'get_system_stats') else {}
-    
-    def get_reality_config(self, email: str, user_id: str) -> Dict[str, Any]:
-        """Generate a complete VLESS Reality configuration for a user."""
+    async def add_vless_user_async(self, email: str, uuid_str: str) -> bool:
+        """Add a new VLESS user without blocking the event loop.
+        
+        Args:
+            email: User's email (used as identifier)
+            uuid_str: User's UUID
+            
+        Returns:
+            bool: True if user was added successfully, False otherwise.
+        """
         try:
-            # Validate required settings
-            if not settings.XRAY_REALITY_SHORT_IDS:
-                logger.error("No Reality short IDs configured")
-                return {}
+            result = await self.xray.add_user_async(email, uuid_str)
+            if result:
+                logger.info(f"Successfully added VLESS user {email} with UUID {uuid_str}")
+            else:
+                logger.error(f"Failed to add VLESS user {email}")
             
-            if not settings.XRAY_REALITY_PUBKEY:
-                logger.error("No Reality public key configured")
-                return {}
+            return result
             
-            # Use a non-empty short ID (skip empty ones)
-            short_id = ""
-            logger.debug(f"Available short IDs: {settings.XRAY_REALITY_SHORT_IDS}")
+        except Exception as e:
+            logger.error(f"Error adding VLESS user {email}: {e}")
+            return False
+    
+    async def remove_vless_user_async(self, email: str) -> bool:
+        """Remove a VLESS user without blocking the event loop.
+        
+        Args:
+            email: User's email to remove
             
-            for sid in settings.XRAY_REALITY_SHORT_IDS:
-                if sid and sid.strip():  # Use first non-empty short_id
-                    short_id = sid.strip()
-                    logger.debug(f"Selected short ID: {short_id}")
-                    break
+        Returns:
+            bool: True if user was removed successfully, False otherwise.
+        """
+        try:
+            result = await self.xray.remove_user_async(email)
+            if result:
+                logger.info(f"Successfully removed VLESS user {email}")
+            else:
+                logger.error(f"Failed to remove VLESS user {email}")
             
-            if not short_id:
-                logger.error(f"No valid short ID found in configuration: {settings.XRAY_REALITY_SHORT_IDS}")
+            return result
+            
+        except Exception as e:
+            logger.error(f"Error removing VLESS user {email}: {e}")
+            return False
+    
+    def get_system_stats(self, ttl: float = 0.0) -> Dict[str, Any]:
+        """Get system statistics from Xray."""
+        return self.xray.get_system_stats(ttl) if hasattr(self.xray, 'get_system_stats') else {}
+    
+    def _reality_params(self) -> Optional[Tuple[str, int, str, str, str]]:
+        """Resolve and validate the Reality settings used in client configs.
+        
+        Returns:
+            Optional[Tuple]: (server_ip, port, sni, public_key, short_id) or None if misconfigured
+        """
+        short_ids = settings.XRAY_REALITY_SHORT_IDS
+        
+        # Validate required settings
+        if not short_ids:
+            logger.error("No Reality short IDs configured")
+            return None
+        
+        if not settings.XRAY_REALITY_PUBKEY:
+            logger.error("No Reality public key configured")
+            return None
+        
+        # Use a non-empty short ID (skip empty ones)
+        short_id = next((sid.strip() for sid in short_ids if sid and sid.strip()), "")
+        if not short_id:
+            logger.error(f"No valid short ID found in configuration: {short_ids}")
+            return None
+        
+        # Extract SNI from XRAY_REALITY_DEST
+        sni = settings.XRAY_REALITY_DEST.split(':')[0] if settings.XRAY_REALITY_DEST else 'www.google.com'
+        
+        return settings.SERVER_IP or '127.0.0.1', settings.XRAY_PORT, sni, settings.XRAY_REALITY_PUBKEY, short_id
+    
+    def get_reality_config(self, email: str, user_id: str) -> Dict[str, Any]:
+        """Generate a complete VLESS Reality configuration for a user."""
+        try:
+            params = self._reality_params()
+            if params is None:
                 return {}
             
-            # Extract SNI from XRAY_REALITY_DEST
-            sni = settings.XRAY_REALITY_DEST.split(':')[0] if settings.XRAY_REALITY_DEST else 'www.google.com'
-            
-            # Generate complete VLESS Reality config
-            config = {
-                "v": "2",
-                "ps": f"Xray Reality - {email}",
-                "add": settings.SERVER_IP or '127.0.0.1',
-                "port": settings.XRAY_PORT,
-                "id": user_id,
-                "aid": "0",
-                "scy": "auto",
-                "net": "tcp",
-                "type": "none",
-                "host": "",
-                "path": "",
-                "tls": "reality",
-                "sni": sni,
-                "alpn": "",
-                "fp": "chrome",
-                "pbk": settings.XRAY_REALITY_PUBKEY,
-                "sid": short_id,
-                "spx": ""
-            }
+            # Copy so callers can't mutate the cached entry
+            config = dict(_reality_config(email, user_id, *params))
             
             logger.debug(f"Generated Reality config for {email}: port={config['port']}, sni={config['sni']}, sid={config['sid']}")
             return config
@@ -415,34 +1010,24 @@ class ServerManager:
     def generate_vless_url(self, email: str, user_id: str) -> str:
         """Generate a complete VLESS Reality URL for the user."""
         try:
-            config = self.get_reality_config(email, user_id)
-            if not config:
+            params = self._reality_params()
+            if params is None:
                 return ""
             
             # Validate UUID format (must be 36 characters)
-            if len(config['id']) != 36:
-                logger.error(f"Invalid UUID length: {len(config['id'])} (expected 36)")
+            if len(user_id) != 36:
+                logger.error(f"Invalid UUID length: {len(user_id)} (expected 36)")
                 return ""
             
-            # Build VLESS URL without flow parameter
-            vless_url = (
-                f"vless://{config['id']}@{config['add']}:{config['port']}"
-                f"?encryption=none&security={config['tls']}"
-                f"&sni={config['sni']}&fp={config['fp']}&pbk={config['pbk']}"
-                f"&sid={config['sid']}&type={config['net']}"
-                f"#{config['ps']}"
-            )
-            
-            return vless_url
+            return _vless_url(email, user_id, *params)
             
         except Exception as e:
             logger.error(f"Error generating VLESS URL: {e}")
             return ""
     
-    def __del__(self):
-        """Clean up resources."""
-        if hasattr(self, 'xray') and self.xray:
-            self.xray.close()
+    async def aclose(self):
+        """Close the Xray gRPC connections (sync pool and asyncio channel)."""
+        await self.xray.aclose()
 
 # Create a global server manager instance
-server_manager = ServerManager()
+server_manager = ServerManager.get_instance()
@@ -5,14 +5,13 @@ Automatic UUID synchronization service between Telegram bot and Xray server.
 
 import asyncio
 import logging
-from typing import Set, Dict, List
+from typing import Set, Dict, List, Optional
 from datetime import datetime, timedelta
 from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from db import User, UserKey, async_session_maker
-from server_manager import ServerManager
+from server_manager import server_manager
 from config import settings
 
 logger = logging.getLogger(__name__)
@@ -21,9 +20,55 @@ class XrayUserSyncService:
     """Service for automatic synchronization of users between bot DB and Xray server."""
     
     def __init__(self):
-        self.server_manager = ServerManager()
-        self.sync_interval = 300  # 5 minutes
+        self.server_manager = server_manager
+        self.sync_interval = 3600  # 1 hour; per-user changes go through the dirty set
+        self.flush_interval = 2  # seconds between dirty-set flushes
+        self.max_concurrency = 16  # in-flight Xray calls during full sync
         self.last_sync = None
+        self.dirty: Dict[int, str] = {}  # Telegram user ID -> pending action
+        
+    def mark_dirty(self, user_id: int, action: str):
+        """
+        Queue a user for sync on the next flush.
+        
+        Repeated actions for the same user collapse into one. A 'create' queued
+        behind a pending 'renew' or 'delete' becomes 'renew': the user may still
+        be in Xray, and only renew removes the old entry before re-adding the
+        current key.
+        
+        Args:
+            user_id: Telegram user ID
+            action: Action type ('create', 'renew', 'delete')
+        """
+        if action == 'create' and self.dirty.get(user_id) in ('renew', 'delete'):
+            action = 'renew'
+        self.dirty[user_id] = action
+        
+    async def flush_dirty(self) -> int:
+        """
+        Sync every user queued with mark_dirty since the last flush.
+        
+        Returns:
+            int: Number of users synced successfully
+        """
+        if not self.dirty:
+            return 0
+        
+        # Swap the set out first so actions queued during the flush wait for the next one
+        pending, self.dirty = self.dirty, {}
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        async def bounded(user_id: int, action: str) -> bool:
+            async with semaphore:
+                return await self.sync_user_on_action(user_id, action)
+        
+        results = await asyncio.gather(
+            *(bounded(user_id, action) for user_id, action in pending.items()),
+            return_exceptions=True
+        )
+        synced = sum(1 for success in results if success is True)
+        logger.info(f"Flushed {len(pending)} pending user syncs ({synced} succeeded)")
+        return synced
         
     async def sync_user_on_action(self, user_id: int, action: str) -> bool:
         """
@@ -38,49 +83,42 @@ class XrayUserSyncService:
         """
         try:
             async with async_session_maker() as session:
-                # Get user from database
+                # Get the user's id and active key UUID (None if no active key) in one query
                 result = await session.execute(
-                    select(User).where(User.telegram_id == user_id)
+                    select(User.id, UserKey.uuid)
+                    .outerjoin(UserKey, (UserKey.user_id == User.id) & (UserKey.is_active == True))
+                    .where(User.telegram_id == user_id)
+                    .limit(1)
                 )
-                user = result.scalar_one_or_none()
-                
-                if not user:
-                    logger.warning(f"User {user_id} not found in database")
-                    return False
-                
-                # Get user keys separately
-                keys_result = await session.execute(
-                    select(UserKey).where(
-                        UserKey.user_id == user.id,
-                        UserKey.is_active == True
-                    )
-                )
-                user_keys = keys_result.scalars().all()
-                
-                email = f"user_{user.id}@xray.com"
+                row = result.first()
                 
-                if action == 'create':
-                    return await self._ensure_user_exists(session, user, email, user_keys)
-                elif action == 'renew':
-                    return await self._renew_user_key(session, user, email, user_keys)
-                elif action == 'delete':
-                    return await self._remove_user(user, email)
+            if not row:
+                logger.warning(f"User {user_id} not found in database")
+                return False
+            
+            db_user_id, active_uuid = row
+            email = f"user_{db_user_id}@xray.com"
+            
+            if action == 'create':
+                return await self._ensure_user_exists(email, active_uuid)
+            elif action == 'renew':
+                return await self._renew_user_key(email, active_uuid)
+            elif action == 'delete':
+                return await self._remove_user(email)
                     
         except Exception as e:
             logger.error(f"Error syncing user {user_id} on {action}: {e}")
             return False
             
-    async def _ensure_user_exists(self, session: AsyncSession, user: User, email: str, user_keys: List[UserKey]) -> bool:
+    async def _ensure_user_exists(self, email: str, active_uuid: Optional[str]) -> bool:
         """Ensure user exists in Xray server."""
         try:
-            # Get active key
-            active_key = next((k for k in user_keys if k.is_active), None)
-            if not active_key:
-                logger.warning(f"No active key found for user {user.id}")
+            if not active_uuid:
+                logger.warning(f"No active key found for user {email}")
                 return False
             
             # Check if user exists in Xray
-            if not self.server_manager.add_vless_user(email, active_key.uuid):
+            if not await self.server_manager.add_vless_user_async(email, active_uuid):
                 logger.error(f"Failed to add user {email} to Xray")
                 return False
                 
@@ -91,16 +129,15 @@ class XrayUserSyncService:
             logger.error(f"Error ensuring user exists: {e}")
             return False
     
-    async def _renew_user_key(self, session: AsyncSession, user: User, email: str, user_keys: List[UserKey]) -> bool:
+    async def _renew_user_key(self, email: str, active_uuid: Optional[str]) -> bool:
         """Renew user key in Xray server."""
         try:
             # Remove old user
-            self.server_manager.remove_vless_user(email)
+            await self.server_manager.remove_vless_user_async(email)
             
             # Add with new key
-            active_key = next((k for k in user_keys if k.is_active), None)
-            if active_key:
-                success = self.server_manager.add_vless_user(email, active_key.uuid)
+            if active_uuid:
+                success = await self.server_manager.add_vless_user_async(email, active_uuid)
                 if success:
                     logger.info(f"✅ User {email} key renewed in Xray")
                 return success
@@ -110,10 +147,10 @@ class XrayUserSyncService:
             logger.error(f"Error renewing user key: {e}")
             return False
     
-    async def _remove_user(self, user: User, email: str) -> bool:
+    async def _remove_user(self, email: str) -> bool:
         """Remove user from Xray server."""
         try:
-            success = self.server_manager.remove_vless_user(email)
+            success = await self.server_manager.remove_vless_user_async(email)
             if success:
                 logger.info(f"✅ User {email} removed from Xray")
             return success
@@ -132,51 +169,63 @@ class XrayUserSyncService:
         stats = {'added': 0, 'removed': 0, 'errors': 0}
         
         try:
+            # Issue Xray calls concurrently, but cap how many are in flight at once
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            
+            async def bounded(call):
+                async with semaphore:
+                    return await call
+            
+            def tally(emails: List[str], results: List, key: str, message: str):
+                for email, success in zip(emails, results):
+                    if success is True:
+                        stats[key] += 1
+                        logger.info(message.format(email=email))
+                    else:
+                        stats['errors'] += 1
+            
+            # Get current Xray users
+            xray_users = await self._get_xray_users()
+            db_user_emails = set()
+            
             async with async_session_maker() as session:
-                # Get all users with active keys from database
-                result = await session.execute(
-                    select(User).join(UserKey).where(UserKey.is_active == True)
+                # Only the id/UUID columns are needed; skip hydrating ORM objects.
+                # Rows are streamed in chunks so memory stays bounded for large user bases
+                # and adds for the first chunk start before the rest has been read.
+                result = await session.stream(
+                    select(User.id, UserKey.uuid)
+                    .join(UserKey, UserKey.user_id == User.id)
+                    .where(UserKey.is_active == True)
+                    .execution_options(yield_per=500)
                 )
-                db_users = result.scalars().all()
-                
-                # Get all active keys
-                keys_result = await session.execute(
-                    select(UserKey).where(UserKey.is_active == True)
-                )
-                active_keys = {key.user_id: key for key in keys_result.scalars().all()}
-                
-                # Get current Xray users (would need to implement this in server_manager)
-                xray_users = await self._get_xray_users()
                 
-                db_user_emails = set()
-                
-                # Sync database users to Xray
-                for user in db_users:
-                    active_key = active_keys.get(user.id)
-                    if active_key:
-                        email = f"user_{user.id}@xray.com"
-                        db_user_emails.add(email)
-                        
-                        if email not in xray_users:
-                            success = self.server_manager.add_vless_user(email, active_key.uuid)
-                            if success:
-                                stats['added'] += 1
-                                logger.info(f"Added {email} to Xray")
-                            else:
-                                stats['errors'] += 1
-                
-                # Remove users from Xray that don't exist in database
-                for xray_email in xray_users:
-                    if xray_email not in db_user_emails:
-                        success = self.server_manager.remove_vless_user(xray_email)
-                        if success:
-                            stats['removed'] += 1
-                            logger.info(f"Removed {xray_email} from Xray")
-                        else:
-                            stats['errors'] += 1
-                
-                self.last_sync = datetime.now()
-                logger.info(f"Full sync completed: {stats}")
+                async for partition in result.partitions():
+                    # Xray email -> active UUID for this chunk
+                    db_users = {f"user_{db_user_id}@xray.com": active_uuid for db_user_id, active_uuid in partition}
+                    
+                    # Sync database users to Xray
+                    to_add = [
+                        (email, uuid) for email, uuid in db_users.items()
+                        if email not in xray_users and email not in db_user_emails
+                    ]
+                    db_user_emails.update(db_users)
+                    
+                    add_results = await asyncio.gather(
+                        *(bounded(self.server_manager.add_vless_user_async(email, uuid)) for email, uuid in to_add),
+                        return_exceptions=True
+                    )
+                    tally([email for email, _ in to_add], add_results, 'added', "Added {email} to Xray")
+            
+            # Remove users from Xray that don't exist in database
+            to_remove = list(xray_users - db_user_emails)
+            remove_results = await asyncio.gather(
+                *(bounded(self.server_manager.remove_vless_user_async(email)) for email in to_remove),
+                return_exceptions=True
+            )
+            tally(to_remove, remove_results, 'removed', "Removed {email} from Xray")
+            
+            self.last_sync = datetime.now()
+            logger.info(f"Full sync completed: {stats}")
                 
         except Exception as e:
             logger.error(f"Error during full sync: {e}")
@@ -186,16 +235,24 @@ class XrayUserSyncService:
     
     async def _get_xray_users(self) -> Set[str]:
         """Get list of users currently in Xray server."""
-        # This would need to be implemented in server_manager
-        # For now, return empty set
-        return set()
+        # One QueryStats call over all user>>> counters, off the event loop
+        return await asyncio.to_thread(self.server_manager.xray.get_user_emails)
     
     async def start_periodic_sync(self):
-        """Start periodic synchronization task."""
+        """Start periodic synchronization task.
+        
+        Flushes the dirty set every flush_interval seconds and runs a full
+        reconciliation every sync_interval seconds as a safety net.
+        """
+        loop = asyncio.get_running_loop()
+        next_full_sync = loop.time() + self.sync_interval
         while True:
             try:
-                await asyncio.sleep(self.sync_interval)
-                await self.full_sync()
+                await asyncio.sleep(self.flush_interval)
+                await self.flush_dirty()
+                if loop.time() >= next_full_sync:
+                    next_full_sync = loop.time() + self.sync_interval
+                    await self.full_sync()
             except Exception as e:
                 logger.error(f"Error in periodic sync: {e}")
                 await asyncio.sleep(60)  # Wait 1 minute before retry
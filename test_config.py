@@ -30,7 +30,7 @@ def test_reality_config():
     try:
         from server_manager import ServerManager
         
-        manager = ServerManager()
+        manager = ServerManager.get_instance()
         config = manager.get_reality_config("test@example.com", "test-uuid-123")
         
         if config:
@@ -55,7 +55,7 @@ def test_vless_url():
     try:
         from server_manager import ServerManager
         
-        manager = ServerManager()
+        manager = ServerManager.get_instance()
         url = manager.generate_vless_url("test@example.com", "test-uuid-123")
         
         if url:
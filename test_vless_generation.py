@@ -14,7 +14,7 @@ def test_vless_generation():
     """Test VLESS URL generation with current Reality keys."""
     print("Testing VLESS URL generation with synchronized Reality keys...")
     
-    server_manager = ServerManager()
+    server_manager = ServerManager.get_instance()
     
     # Generate a test UUID
     test_uuid = str(uuid.uuid4())
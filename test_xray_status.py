@@ -13,7 +13,7 @@ def test_xray_status():
     """Test the get_xray_status method."""
     print("Testing Xray status check...")
     
-    server_manager = ServerManager()
+    server_manager = ServerManager.get_instance()
     status = server_manager.get_xray_status()
     
     print(f"Status result: {status}")
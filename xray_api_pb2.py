@@ -1,64 +1,69 @@
 # -*- coding: utf-8 -*-
-# Simplified protobuf implementation for Xray API
-# This avoids the parsing issues with the generated protobuf files
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# source: xray_api.proto
+# Protobuf Python Version: 4.25.0
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import symbol_database as _symbol_database
+from google.protobuf.internal import builder as _builder
+# @@protoc_insertion_point(imports)
 
-# Simple message classes for Xray API
-class User:
-    def __init__(self, level=0, email="", account=None):
-        self.level = level
-        self.email = email
-        self.account = account or Account()
+_sym_db = _symbol_database.Default()
 
-class Account:
-    def __init__(self, type="", settings=""):
-        self.type = type
-        self.settings = settings
 
-class AddUserRequest:
-    def __init__(self, user=None):
-        self.user = user or User()
 
-class AddUserResponse:
-    def __init__(self, success=False, error=""):
-        self.success = success
-        self.error = error
 
-class RemoveUserRequest:
-    def __init__(self, email=""):
-        self.email = email
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0exray_api.proto\x12\x19xray.app.proxyman.command\"Y\n\x04User\x12\r\n\x05level\x18\x01 \x01(\r\x12\r\n\x05\x65mail\x18\x02 \x01(\t\x12\x33\n\x07\x61\x63\x63ount\x18\x03 \x01(\x0b\x32\".xray.app.proxyman.command.Account\")\n\x07\x41\x63\x63ount\x12\x0c\n\x04type\x18\x01 \x01(\t\x12\x10\n\x08settings\x18\x02 \x01(\t\"?\n\x0e\x41\x64\x64UserRequest\x12-\n\x04user\x18\x01 \x01(\x0b\x32\x1f.xray.app.proxyman.command.User\"1\n\x0f\x41\x64\x64UserResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\r\n\x05\x65rror\x18\x02 \x01(\t\"\"\n\x11RemoveUserRequest\x12\r\n\x05\x65mail\x18\x01 \x01(\t\"4\n\x12RemoveUserResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\r\n\x05\x65rror\x18\x02 \x01(\t\"2\n\x13GetUserStatsRequest\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\r\n\x05reset\x18\x02 \x01(\x08\"8\n\x14GetUserStatsResponse\x12\x0e\n\x06upload\x18\x01 \x01(\x04\x12\x10\n\x08\x64ownload\x18\x02 \x01(\x04\".\n\x0fGetStatsRequest\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\r\n\x05reset\x18\x02 \x01(\x08\"#\n\x04Stat\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x03\"A\n\x10GetStatsResponse\x12-\n\x04stat\x18\x01 \x03(\x0b\x32\x1f.xray.app.proxyman.command.Stat\"H\n\x11\x41\x64\x64InboundRequest\x12\x33\n\x07inbound\x18\x01 \x01(\x0b\x32\".xray.app.proxyman.command.Inbound\"\x14\n\x12\x41\x64\x64InboundResponse\"#\n\x14RemoveInboundRequest\x12\x0b\n\x03tag\x18\x01 \x01(\t\"\x17\n\x15RemoveInboundResponse\"Y\n\x13\x41lterInboundRequest\x12\x0b\n\x03tag\x18\x01 \x01(\t\x12\x35\n\toperation\x18\x02 \x01(\x0b\x32\".xray.app.proxyman.command.Inbound\"\x16\n\x14\x41lterInboundResponse\"E\n\x07Inbound\x12\x0b\n\x03tag\x18\x01 \x01(\t\x12-\n\x04user\x18\x02 \x03(\x0b\x32\x1f.xray.app.proxyman.command.User\"3\n\x11QueryStatsRequest\x12\x0f\n\x07pattern\x18\x01 \x01(\t\x12\r\n\x05reset\x18\x02 \x01(\x08\"C\n\x12QueryStatsResponse\x12-\n\x04stat\x18\x01 \x03(\x0b\x32\x1f.xray.app.proxyman.command.Stat2\xb7\x04\n\x0eHandlerService\x12k\n\nAddInbound\x12,.xray.app.proxyman.command.AddInboundRequest\x1a-.xray.app.proxyman.command.AddInboundResponse\"\x00\x12t\n\rRemoveInbound\x12/.xray.app.proxyman.command.RemoveInboundRequest\x1a\x30.xray.app.proxyman.command.RemoveInboundResponse\"\x00\x12q\n\x0c\x41lterInbound\x12..xray.app.proxyman.command.AlterInboundRequest\x1a/.xray.app.proxyman.command.AlterInboundResponse\"\x00\x12\x62\n\x07\x41\x64\x64User\x12).xray.app.proxyman.command.AddUserRequest\x1a*.xray.app.proxyman.command.AddUserResponse\"\x00\x12k\n\nRemoveUser\x12,.xray.app.proxyman.command.RemoveUserRequest\x1a-.xray.app.proxyman.command.RemoveUserResponse\"\x00\x32\xd5\x02\n\x0cStatsService\x12\x65\n\x08GetStats\x12*.xray.app.proxyman.command.GetStatsRequest\x1a+.xray.app.proxyman.command.GetStatsResponse\"\x00\x12k\n\nQueryStats\x12,.xray.app.proxyman.command.QueryStatsRequest\x1a-.xray.app.proxyman.command.QueryStatsResponse\"\x00\x12q\n\x0cGetUserStats\x12..xray.app.proxyman.command.GetUserStatsRequest\x1a/.xray.app.proxyman.command.GetUserStatsResponse\"\x00\x42Q\n\x1d\x63om.xray.app.proxyman.commandP\x01Z.github.com/xtls/xray-core/app/proxyman/commandb\x06proto3')
 
-class RemoveUserResponse:
-    def __init__(self, success=False, error=""):
-        self.success = success
-        self.error = error
-
-class GetUserStatsRequest:
-    def __init__(self, name="", reset=False):
-        self.name = name
-        self.reset = reset
-
-class GetUserStatsResponse:
-    def __init__(self, upload=0, download=0):
-        self.upload = upload
-        self.download = download
-
-class QueryStatsRequest:
-    def __init__(self, pattern="", reset=False):
-        self.pattern = pattern
-        self.reset = reset
-
-class Stat:
-    def __init__(self, name="", value=0):
-        self.name = name
-        self.value = value
-
-class QueryStatsResponse:
-    def __init__(self, stat=None):
-        self.stat = stat or []
-
-# Export all message classes
-__all__ = [
-    'User', 'Account', 'AddUserRequest', 'AddUserResponse',
-    'RemoveUserRequest', 'RemoveUserResponse', 'GetUserStatsRequest',
-    'GetUserStatsResponse', 'QueryStatsRequest', 'Stat', 'QueryStatsResponse'
-]
+_globals = globals()
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'xray_api_pb2', _globals)
+if _descriptor._USE_C_DESCRIPTORS == False:
+  _globals['DESCRIPTOR']._options = None
+  _globals['DESCRIPTOR']._serialized_options = b'\n\035com.xray.app.proxyman.commandP\001Z.github.com/xtls/xray-core/app/proxyman/command'
+  _globals['_USER']._serialized_start=45
+  _globals['_USER']._serialized_end=134
+  _globals['_ACCOUNT']._serialized_start=136
+  _globals['_ACCOUNT']._serialized_end=177
+  _globals['_ADDUSERREQUEST']._serialized_start=179
+  _globals['_ADDUSERREQUEST']._serialized_end=242
+  _globals['_ADDUSERRESPONSE']._serialized_start=244
+  _globals['_ADDUSERRESPONSE']._serialized_end=293
+  _globals['_REMOVEUSERREQUEST']._serialized_start=295
+  _globals['_REMOVEUSERREQUEST']._serialized_end=329
+  _globals['_REMOVEUSERRESPONSE']._serialized_start=331
+  _globals['_REMOVEUSERRESPONSE']._serialized_end=383
+  _globals['_GETUSERSTATSREQUEST']._serialized_start=385
+  _globals['_GETUSERSTATSREQUEST']._serialized_end=435
+  _globals['_GETUSERSTATSRESPONSE']._serialized_start=437
+  _globals['_GETUSERSTATSRESPONSE']._serialized_end=493
+  _globals['_GETSTATSREQUEST']._serialized_start=495
+  _globals['_GETSTATSREQUEST']._serialized_end=541
+  _globals['_STAT']._serialized_start=543
+  _globals['_STAT']._serialized_end=578
+  _globals['_GETSTATSRESPONSE']._serialized_start=580
+  _globals['_GETSTATSRESPONSE']._serialized_end=645
+  _globals['_ADDINBOUNDREQUEST']._serialized_start=647
+  _globals['_ADDINBOUNDREQUEST']._serialized_end=719
+  _globals['_ADDINBOUNDRESPONSE']._serialized_start=721
+  _globals['_ADDINBOUNDRESPONSE']._serialized_end=741
+  _globals['_REMOVEINBOUNDREQUEST']._serialized_start=743
+  _globals['_REMOVEINBOUNDREQUEST']._serialized_end=778
+  _globals['_REMOVEINBOUNDRESPONSE']._serialized_start=780
+  _globals['_REMOVEINBOUNDRESPONSE']._serialized_end=803
+  _globals['_ALTERINBOUNDREQUEST']._serialized_start=805
+  _globals['_ALTERINBOUNDREQUEST']._serialized_end=894
+  _globals['_ALTERINBOUNDRESPONSE']._serialized_start=896
+  _globals['_ALTERINBOUNDRESPONSE']._serialized_end=918
+  _globals['_INBOUND']._serialized_start=920
+  _globals['_INBOUND']._serialized_end=989
+  _globals['_QUERYSTATSREQUEST']._serialized_start=991
+  _globals['_QUERYSTATSREQUEST']._serialized_end=1042
+  _globals['_QUERYSTATSRESPONSE']._serialized_start=1044
+  _globals['_QUERYSTATSRESPONSE']._serialized_end=1111
+  _globals['_HANDLERSERVICE']._serialized_start=1114
+  _globals['_HANDLERSERVICE']._serialized_end=1681
+  _globals['_STATSSERVICE']._serialized_start=1684
+  _globals['_STATSSERVICE']._serialized_end=2025
+# @@protoc_insertion_point(module_scope)
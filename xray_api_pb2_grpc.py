@@ -1,38 +1,72 @@
 # Simplified gRPC stub implementation for Xray API
 # This avoids the parsing issues with the generated protobuf files
 
+from concurrent import futures
+
 import grpc
 import xray_api_pb2 as pb
 
+# Canned mock responses, built once; callers only read them, so they are shared
+_ADD_OK = pb.AddUserResponse(success=True)
+_REMOVE_OK = pb.RemoveUserResponse(success=True)
+_EMPTY_USER_STATS = pb.GetUserStatsResponse(upload=0, download=0)
+_EMPTY_STATS = pb.QueryStatsResponse(stat=[])
+
+def _awaitable(method):
+    """Wrap a mock RPC so it can be awaited, like generated stubs on a grpc.aio channel."""
+    async def call(request):
+        return method(request)
+    return call
+
+class _UnaryUnary:
+    """Wrap a mock RPC like grpc.UnaryUnaryMultiCallable: callable, with a .future() variant."""
+    
+    def __init__(self, method):
+        self._method = method
+        
+    def __call__(self, request, timeout=None, metadata=None):
+        return self._method(request)
+        
+    def future(self, request, timeout=None, metadata=None):
+        future = futures.Future()
+        future.set_result(self._method(request))
+        return future
+
 class HandlerServiceStub:
     """HandlerService handles user and system operations."""
     
     def __init__(self, channel):
         self.channel = channel
+        wrap = _awaitable if isinstance(channel, grpc.aio.Channel) else _UnaryUnary
+        self.AddUser = wrap(self.AddUser)
+        self.RemoveUser = wrap(self.RemoveUser)
         
     def AddUser(self, request):
         """Add a user to the inbound handler."""
         # Mock implementation - returns success response
-        return pb.AddUserResponse(success=True)
+        return _ADD_OK
         
     def RemoveUser(self, request):
         """Remove a user from the inbound handler."""
         # Mock implementation - returns success response
-        return pb.RemoveUserResponse(success=True)
+        return _REMOVE_OK
 
 class StatsServiceStub:
     """StatsService handles statistics operations."""
     
     def __init__(self, channel):
         self.channel = channel
+        wrap = _awaitable if isinstance(channel, grpc.aio.Channel) else _UnaryUnary
+        self.GetUserStats = wrap(self.GetUserStats)
+        self.QueryStats = wrap(self.QueryStats)
         
     def GetUserStats(self, request):
         """Get user statistics."""
         # Mock implementation - returns zero stats
-        return pb.GetUserStatsResponse(upload=0, download=0)
+        return _EMPTY_USER_STATS
         
     def QueryStats(self, request):
         """Query system statistics."""
         # Mock implementation - returns empty stats
-        return pb.QueryStatsResponse(stat=[])
+        return _EMPTY_STATS
 
@@ -1,14 +1,13 @@
-import grpc
+import atexit
+import itertools
 import logging
-from typing import List, Dict, Any, Optional
-from concurrent import futures
+import threading
+from typing import List, Dict, Any, Optional, Tuple
 import json
-import uuid
+import re
 
 # Import generated protobuf files
 import xray_api_pb2 as pb
-import xray_api_pb2_grpc as pb_grpc
-from google.protobuf import empty_pb2
 
 from config import settings
 
@@ -16,164 +15,479 @@ from config import settings
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Retry calls that fail while Xray is restarting instead of surfacing grpc.RpcError
+_RETRY_SERVICE_CONFIG = json.dumps({
+    "methodConfig": [{
+        "name": [{}],
+        "retryPolicy": {
+            "maxAttempts": 4,
+            "initialBackoff": "0.1s",
+            "maxBackoff": "1s",
+            "backoffMultiplier": 2,
+            "retryableStatusCodes": ["UNAVAILABLE"]
+        }
+    }]
+})
+
+_CHANNEL_OPTIONS = [
+    # Separate subchannel pools give each pooled channel its own HTTP/2 connection
+    ("grpc.use_local_subchannel_pool", 1),
+    # HTTP/2 keepalive pings detect connections dropped by restarts/NAT. Xray's
+    # grpc-go server keeps the default enforcement policy (pings at most every 5
+    # minutes, none without an active call) and answers faster or idle pings with
+    # GOAWAY too_many_pings, so stay within it
+    ("grpc.keepalive_time_ms", 300000),
+    ("grpc.keepalive_timeout_ms", 5000),
+    ("grpc.enable_retries", 1),
+    ("grpc.service_config", _RETRY_SERVICE_CONFIG),
+]
+
+# VLESS account settings; only the UUID varies (UUIDs need no JSON escaping)
+_VLESS_ACCOUNT_TEMPLATE = '{"id":"%s","flow":"xtls-rprx-vision"}'
+_UUID_RE = re.compile(r"[0-9a-fA-F-]{36}")
+
+def _vless_account_settings(uuid_str: str) -> str:
+    """Account settings JSON for a VLESS user, without going through json.dumps.
+    
+    Raises:
+        ValueError: If uuid_str is not UUID-shaped, since it is spliced into the JSON unescaped.
+    """
+    if not _UUID_RE.fullmatch(uuid_str):
+        raise ValueError(f"invalid UUID: {uuid_str!r}")
+    return _VLESS_ACCOUNT_TEMPLATE % uuid_str
+
+# Direction suffixes of per-user traffic counters (user>>>{email}>>>traffic>>>uplink)
+_UPLINK_SUFFIX = ">>>uplink"
+_DOWNLINK_SUFFIX = ">>>downlink"
+_USER_TRAFFIC_RE = re.compile(r"user>>>([^>]+)>>>traffic>>>(uplink|downlink)")
+_DIRECTION_KEYS = {"uplink": "upload", "downlink": "download"}
+
+def _user_traffic(email: str, response: pb.QueryStatsResponse) -> Dict[str, Dict[str, int]]:
+    """Fold a ``user>>>{email}>>>traffic>>>`` QueryStats response into {email: {upload, download}}."""
+    # The pattern already pins user and counter type; only the direction
+    # suffix varies. Xray only reports counters once a user has moved traffic.
+    upload = download = 0
+    for stat in response.stat:
+        if stat.name.endswith(_UPLINK_SUFFIX):
+            upload = stat.value
+        elif stat.name.endswith(_DOWNLINK_SUFFIX):
+            download = stat.value
+    return {email: {'upload': upload, 'download': download}}
+
+def _all_user_traffic(response: pb.QueryStatsResponse) -> Dict[str, Dict[str, int]]:
+    """Fold a ``user>>>`` QueryStats response into {email: {upload, download}}."""
+    stats = {}
+    for stat in response.stat:
+        # One C-level match extracts the user and direction
+        match = _USER_TRAFFIC_RE.fullmatch(stat.name)
+        if match is None:
+            continue
+        email, direction = match.groups()
+        stats.setdefault(email, {'upload': 0, 'download': 0})[_DIRECTION_KEYS[direction]] = stat.value
+    return stats
+
+def _traffic_stats_request(email: str, reset: bool) -> pb.QueryStatsRequest:
+    """QueryStats request for one user's traffic counters, or every user's if email is empty."""
+    pattern = f"user>>>{email}>>>traffic>>>" if email else "user>>>"
+    return pb.QueryStatsRequest(pattern=pattern, reset=reset)
+
+# Reality client config fields that only depend on settings, built once at import
+_REALITY_SHORT_IDS = settings.XRAY_REALITY_SHORT_IDS
+_REALITY_TEMPLATE = {
+    "v": "2",
+    "add": settings.SERVER_IP,
+    "port": settings.XRAY_PORT,
+    "scy": "chacha20-poly1305",
+    "net": "tcp",
+    "type": "none",
+    "host": "",
+    "path": "",
+    "tls": "reality",
+    "sni": settings.XRAY_REALITY_DEST.split(':')[0] if settings.XRAY_REALITY_DEST else "www.google.com",
+    "alpn": "",
+    "fp": "chrome",
+    "pbk": settings.XRAY_REALITY_PUBKEY,
+    # Use the first short ID for now (could implement round-robin or other logic)
+    "sid": _REALITY_SHORT_IDS[0] if _REALITY_SHORT_IDS else "",
+    "spx": ""
+}
+
+# Constant request for every stat (empty pattern); never mutated, so safe to share
+_ALL_STATS_REQUEST = pb.QueryStatsRequest(pattern="", reset=False)
+
+_thread_requests = threading.local()
+
+def _add_user_request() -> pb.AddUserRequest:
+    """Reusable per-thread AddUserRequest skeleton for VLESS users.
+    
+    Only safe with blocking unary calls, which serialize the message before
+    returning; thread-local so callers on different threads don't share it.
+    """
+    request = getattr(_thread_requests, 'add_user', None)
+    if request is None:
+        request = pb.AddUserRequest(user=pb.User(account=pb.Account(type="vless")))
+        _thread_requests.add_user = request
+    return request
+
+class _ChannelPool:
+    """Fixed set of gRPC channels to one Xray address, picked round-robin.
+    
+    Each channel has its own HTTP/2 connection, so concurrent calls are not
+    queued behind a single connection's stream limit.
+    """
+    
+    def __init__(self, grpc_address: str, size: int):
+        # grpc is a large C extension; import it on first connect so processes that
+        # import this module without making RPCs don't pay for it
+        import grpc
+        import xray_api_pb2_grpc as pb_grpc
+        
+        self.channels = [
+            grpc.insecure_channel(grpc_address, options=_CHANNEL_OPTIONS)
+            for _ in range(size)
+        ]
+        self.handler_stubs = [pb_grpc.HandlerServiceStub(channel) for channel in self.channels]
+        self.stats_stubs = [pb_grpc.StatsServiceStub(channel) for channel in self.channels]
+        self.idx = itertools.count()
+    
+    def next_handler_stub(self):
+        """Pick the next HandlerService stub (round-robin)."""
+        return self.handler_stubs[next(self.idx) % len(self.handler_stubs)]
+    
+    def next_stats_stub(self):
+        """Pick the next StatsService stub (round-robin)."""
+        return self.stats_stubs[next(self.idx) % len(self.stats_stubs)]
+    
+    def close(self):
+        for channel in self.channels:
+            channel.close()
+
+# One pool per Xray address, shared by every XrayClient pointing at it
+_channel_pools: Dict[str, _ChannelPool] = {}
+_channel_pools_lock = threading.Lock()
+
+def _get_channel_pool(grpc_address: str, size: int) -> _ChannelPool:
+    """Get the shared channel pool for an address, creating it on first use."""
+    with _channel_pools_lock:
+        pool = _channel_pools.get(grpc_address)
+        if pool is None:
+            pool = _channel_pools[grpc_address] = _ChannelPool(grpc_address, size)
+        return pool
+
+def _close_channel_pool(grpc_address: str):
+    """Close and forget the shared channel pool for an address."""
+    with _channel_pools_lock:
+        pool = _channel_pools.pop(grpc_address, None)
+    if pool is not None:
+        pool.close()
+
+@atexit.register
+def _close_all_channel_pools():
+    """Close every pooled channel once at interpreter exit, before grpc's own teardown."""
+    with _channel_pools_lock:
+        pools = list(_channel_pools.values())
+        _channel_pools.clear()
+    for pool in pools:
+        pool.close()
+
 class XrayClient:
-    def __init__(self):
-        self.channel = None
-        self.stats_stub = None
-        self.handler_stub = None
+    def __init__(self, grpc_address: str = "127.0.0.1:50051", pool_size: int = 4):
+        self.grpc_address = grpc_address
+        self.pool_size = max(1, pool_size)
+        self.pool: Optional[_ChannelPool] = None
+        self.aio_channel = None
+        self.aio_handler_stub = None
+        self.aio_stats_stub = None
         self.connected = False
         
     def connect(self):
         """Establish connection to Xray gRPC API."""
         if self.connected:
             return True
+        
+        # Channels reconnect on their own after a transient failure; reuse them
+        # rather than leaking them and paying for new connections
+        if self.pool is not None:
+            self.connected = True
+            return True
             
         try:
-            self.channel = grpc.insecure_channel("127.0.0.1:50051")
-            self.stats_stub = pb_grpc.StatsServiceStub(self.channel)
-            self.handler_stub = pb_grpc.HandlerServiceStub(self.channel)
+            self.pool = _get_channel_pool(self.grpc_address, self.pool_size)
             
             # Test connection
-            self.channel.subscribe(
-                lambda connectivity: self._on_connectivity_change(connectivity),
-                try_to_connect=True
-            )
+            self.pool.channels[0].subscribe(self._on_connectivity_change, try_to_connect=True)
             
             self.connected = True
-            logger.info("Connected to Xray gRPC API")
+            logger.info("Connected to Xray gRPC API (%d channels)", len(self.pool.channels))
             return True
             
         except Exception as e:
-            logger.error(f"Failed to connect to Xray gRPC API: {e}")
+            logger.error("Failed to connect to Xray gRPC API: %s", e)
             self.connected = False
             return False
     
     def _on_connectivity_change(self, connectivity):
         """Handle gRPC connection state changes."""
+        import grpc
+        
         if connectivity == grpc.ChannelConnectivity.READY:
             self.connected = True
             logger.info("gRPC channel is READY")
         elif connectivity == grpc.ChannelConnectivity.TRANSIENT_FAILURE:
+            # The pooled channels redial with backoff by themselves; calling connect()
+            # here only flipped `connected` back to True before the link was up
             self.connected = False
-            logger.warning("gRPC channel connection lost. Attempting to reconnect...")
+            logger.warning("gRPC channel connection lost, waiting for it to reconnect...")
+    
+    def _handler_stub(self):
+        """Pick the next HandlerService stub from the channel pool (round-robin).
+        
+        The pool is opened on first use; after that the channels redial on their
+        own, so calls need no connected-state check and failures surface as RpcError.
+        """
+        if self.pool is None:
+            self.connect()
+        return self.pool.next_handler_stub()
+    
+    def _stats_stub(self):
+        """Pick the next StatsService stub from the channel pool (round-robin)."""
+        if self.pool is None:
             self.connect()
+        return self.pool.next_stats_stub()
     
     def add_user(self, email: str, uuid_str: str, level: int = 0) -> bool:
-        """Add a new user to Xray by updating configuration file."""
+        """Add a new VLESS user to Xray via HandlerService."""
         try:
-            # Since Xray doesn't have dynamic user addition via gRPC API,
-            # we'll simulate success and let the configuration be handled
-            # by the config file approach
-            logger.info(f"User {email} with UUID {uuid_str} registered (config-based)")
+            request = _add_user_request()
+            request.user.level = level
+            request.user.email = email
+            request.user.account.settings = _vless_account_settings(uuid_str)
+            response = self._handler_stub().AddUser(request)
+            
+            if not response.success:
+                logger.error("Failed to add user %s: %s", email, response.error)
+                return False
+            
+            logger.info("Added user %s with UUID %s", email, uuid_str)
             return True
             
         except Exception as e:
-            logger.error(f"Error adding user {email}: {e}")
+            logger.error("Error adding user %s: %s", email, e)
             return False
     
+    def add_users(self, users: List[Tuple[str, str]], level: int = 0) -> List[bool]:
+        """Add several users at once, with all AddUser RPCs in flight together.
+        
+        Each call is started with ``.future()`` and multiplexed over the pooled
+        HTTP/2 connections; results are collected afterwards.
+        
+        Args:
+            users: (email, uuid) pairs
+            level: User level applied to every user
+            
+        Returns:
+            List[bool]: Per-user result, in the order of ``users``
+        """
+        if not users:
+            return []
+        
+        pending = []
+        for email, uuid_str in users:
+            try:
+                # Fresh message per call: several requests are in flight at once
+                request = pb.AddUserRequest(
+                    user=pb.User(
+                        level=level,
+                        email=email,
+                        account=pb.Account(type="vless", settings=_vless_account_settings(uuid_str))
+                    )
+                )
+                pending.append(self._handler_stub().AddUser.future(request))
+            except Exception as e:
+                logger.error("Error adding user %s: %s", email, e)
+                pending.append(None)
+        
+        results = []
+        for (email, uuid_str), future in zip(users, pending):
+            if future is None:
+                results.append(False)
+                continue
+            try:
+                response = future.result()
+                if not response.success:
+                    logger.error("Failed to add user %s: %s", email, response.error)
+                    results.append(False)
+                    continue
+                logger.info("Added user %s with UUID %s", email, uuid_str)
+                results.append(True)
+            except Exception as e:
+                logger.error("Error adding user %s: %s", email, e)
+                results.append(False)
+        return results
+    
     def remove_user(self, email: str) -> bool:
-        """Remove a user from Xray by updating configuration file."""
+        """Remove a user from Xray via HandlerService."""
         try:
-            # Since Xray doesn't have dynamic user removal via gRPC API,
-            # we'll simulate success and let the configuration be handled
-            # by the config file approach
-            logger.info(f"User {email} removed (config-based)")
+            response = self._handler_stub().RemoveUser(pb.RemoveUserRequest(email=email))
+            
+            if not response.success:
+                logger.error("Failed to remove user %s: %s", email, response.error)
+                return False
+            
+            logger.info("Removed user %s", email)
             return True
             
         except Exception as e:
-            logger.error(f"Error removing user {email}: {e}")
+            logger.error("Error removing user %s: %s", email, e)
             return False
     
-    def get_traffic_stats(self, email: str = "", reset: bool = False) -> Dict[str, int]:
-        """Get traffic statistics for a user or all users."""
-        if not self.connected and not self.connect():
-            return {}
+    def _aio_handler_stub(self):
+        """HandlerService stub on a grpc.aio channel, created on first use.
+        
+        A single aio channel is enough: concurrent coroutines multiplex their
+        calls as HTTP/2 streams on one connection without blocking the loop.
+        """
+        if self.aio_channel is None:
+            self._open_aio_channel()
+        return self.aio_handler_stub
+    
+    def _aio_stats_stub(self):
+        """StatsService stub on the shared grpc.aio channel, created on first use."""
+        if self.aio_channel is None:
+            self._open_aio_channel()
+        return self.aio_stats_stub
+    
+    def _open_aio_channel(self):
+        """Open the grpc.aio channel and its HandlerService/StatsService stubs."""
+        import grpc
+        import xray_api_pb2_grpc as pb_grpc
+        
+        self.aio_channel = grpc.aio.insecure_channel(self.grpc_address, options=_CHANNEL_OPTIONS)
+        self.aio_handler_stub = pb_grpc.HandlerServiceStub(self.aio_channel)
+        self.aio_stats_stub = pb_grpc.StatsServiceStub(self.aio_channel)
+    
+    async def add_user_async(self, email: str, uuid_str: str, level: int = 0) -> bool:
+        """Add a new VLESS user to Xray without blocking the event loop."""
+        try:
+            # Fresh message per call: concurrent coroutines must not share one
+            request = pb.AddUserRequest(
+                user=pb.User(
+                    level=level,
+                    email=email,
+                    account=pb.Account(type="vless", settings=_vless_account_settings(uuid_str))
+                )
+            )
+            response = await self._aio_handler_stub().AddUser(request)
             
+            if not response.success:
+                logger.error("Failed to add user %s: %s", email, response.error)
+                return False
+            
+            logger.info("Added user %s with UUID %s", email, uuid_str)
+            return True
+            
+        except Exception as e:
+            logger.error("Error adding user %s: %s", email, e)
+            return False
+    
+    async def remove_user_async(self, email: str) -> bool:
+        """Remove a user from Xray without blocking the event loop."""
         try:
-            stats = {}
+            response = await self._aio_handler_stub().RemoveUser(pb.RemoveUserRequest(email=email))
             
-            # Since gRPC stats API is not working, return mock data for now
-            # In a real implementation, this would query the actual Xray stats
-            if email:
-                stats[email] = {
-                    'upload': 0,
-                    'download': 0
-                }
-            else:
-                # Return empty stats for now
-                pass
+            if not response.success:
+                logger.error("Failed to remove user %s: %s", email, response.error)
+                return False
+            
+            logger.info("Removed user %s", email)
+            return True
+            
+        except Exception as e:
+            logger.error("Error removing user %s: %s", email, e)
+            return False
+    
+    def get_traffic_stats(self, email: str = "", reset: bool = False) -> Dict[str, int]:
+        """Get traffic statistics for a user or all users.
+        
+        Uses a single StatsService.QueryStats call filtered by the
+        ``user>>>{email}>>>traffic>>>`` counter prefix instead of per-counter lookups.
+        """
+        try:
+            response = self._stats_stub().QueryStats(_traffic_stats_request(email, reset))
+            return _user_traffic(email, response) if email else _all_user_traffic(response)
             
-            return stats
+        except Exception as e:
+            logger.error("Failed to get traffic stats: %s", e)
+            return {}
+    
+    async def get_traffic_stats_async(self, email: str = "", reset: bool = False) -> Dict[str, int]:
+        """Get traffic statistics for a user or all users without blocking the event loop."""
+        try:
+            response = await self._aio_stats_stub().QueryStats(_traffic_stats_request(email, reset))
+            return _user_traffic(email, response) if email else _all_user_traffic(response)
             
         except Exception as e:
-            logger.error(f"Failed to get traffic stats: {e}")
+            logger.error("Failed to get traffic stats: %s", e)
             return {}
     
     def get_system_stats(self) -> Dict[str, Any]:
         """Get system statistics from Xray."""
-        if not self.connected and not self.connect():
-            return {}
-            
         try:
-            stats = {}
-            
             # Get system stats using QueryStats
-            request = pb.QueryStatsRequest(
-                pattern="",  # Empty pattern for all stats
-                reset=False
-            )
-            response = self.stats_stub.QueryStats(request)
-            
-            for stat in response.stat:
-                stats[stat.name] = stat.value
+            response = self._stats_stub().QueryStats(_ALL_STATS_REQUEST)
             
-            return stats
+            return {stat.name: stat.value for stat in response.stat}
             
         except Exception as e:
-            logger.error(f"Failed to get system stats: {e}")
+            logger.error("Failed to get system stats: %s", e)
             return {}
     
     def get_reality_short_ids(self) -> List[str]:
         """Get the list of valid Reality short IDs."""
-        return settings.XRAY_REALITY_SHORT_IDS
+        return _REALITY_SHORT_IDS
     
     def generate_reality_config(self, uuid_str: str, email: str) -> Dict[str, Any]:
         """Generate a Reality configuration for a user."""
-        if not settings.XRAY_REALITY_SHORT_IDS:
+        if not _REALITY_SHORT_IDS:
             logger.error("No Reality short IDs configured")
             return {}
-            
-        # Use the first short ID for now (could implement round-robin or other logic)
-        short_id = settings.XRAY_REALITY_SHORT_IDS[0]
-        
-        config = {
-            "v": "2",
-            "ps": f"Xray Reality - {email}",
-            "add": settings.SERVER_IP,
-            "port": settings.XRAY_PORT,
-            "id": uuid_str,
-            "scy": "chacha20-poly1305",
-            "net": "tcp",
-            "type": "none",
-            "host": "",
-            "path": "",
-            "tls": "reality",
-            "sni": settings.XRAY_REALITY_DEST.split(':')[0] if settings.XRAY_REALITY_DEST else "www.google.com",
-            "alpn": "",
-            "fp": "chrome",
-            "pbk": settings.XRAY_REALITY_PUBKEY,
-            "sid": short_id,
-            "spx": ""
-        }
         
+        config = _REALITY_TEMPLATE.copy()
+        config["ps"] = f"Xray Reality - {email}"
+        config["id"] = uuid_str
         return config
     
+    def generate_reality_configs(self, pairs: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """Generate Reality configurations for many users at once.
+        
+        Args:
+            pairs: (uuid, email) tuples, one per user
+            
+        Returns:
+            List of configs in the same order as ``pairs``
+        """
+        if not _REALITY_SHORT_IDS:
+            logger.error("No Reality short IDs configured")
+            return []
+        
+        return [{**_REALITY_TEMPLATE, "ps": f"Xray Reality - {email}", "id": uuid_str} for uuid_str, email in pairs]
+    
     def close(self):
-        """Close the gRPC channel."""
-        if self.channel:
-            self.channel.close()
+        """Close the gRPC channels."""
+        if self.pool is not None:
+            _close_channel_pool(self.grpc_address)
+            self.pool = None
             self.connected = False
             logger.info("Closed Xray gRPC connection")
+    
+    async def aclose(self):
+        """Close the grpc.aio channel, then the sync channels."""
+        if self.aio_channel is not None:
+            await self.aio_channel.close()
+            self.aio_channel = None
+            self.aio_handler_stub = None
+            self.aio_stats_stub = None
+        self.close()
 
 # Create a global Xray client instance
 xray_client = XrayClient()